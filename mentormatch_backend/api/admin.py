@@ -21,11 +21,11 @@ class VerificationRequestAdmin(admin.ModelAdmin):
     actions = ['approve_requests', 'reject_requests']
 
     def approve_requests(self, request, queryset):
-        for req in queryset:
-            req.approve(reviewer=request.user)
+        count = queryset.approve(reviewer=request.user)
+        self.message_user(request, f'Approved {count} verification request(s).')
     approve_requests.short_description = 'Approve selected verification requests'
 
     def reject_requests(self, request, queryset):
-        for req in queryset:
-            req.reject(reviewer=request.user)
+        count = queryset.reject(reviewer=request.user)
+        self.message_user(request, f'Rejected {count} verification request(s).')
     reject_requests.short_description = 'Reject selected verification requests'
@@ -0,0 +1,270 @@
+import json
+import os
+import platform
+import random
+import shutil
+import sqlite3
+import statistics
+import subprocess
+import tempfile
+import time
+import tracemalloc
+
+import django
+from django.conf import settings
+from django.core.cache import cache
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from rest_framework.test import APIClient
+from api import vocabulary
+from api.matching import wait_for_score_refreshes
+from api.models import User, Match, Skill
+from api.querybudget import QueryCounter
+from api.serializers import ProfileUpdateSerializer
+
+# Seeds SQLite databases at several scales (see populate_users) and times the
+# hot paths against each of them. A seeded database is kept next to the
+# results and reused by later runs with the same scale and seed; every run
+# measures a fresh copy of it, so writes from one run never leak into the
+# next and results are comparable across commits.
+
+SUFFIXES = {'k': 1_000, 'm': 1_000_000}
+PROFESSIONAL_SHARE = 0.2
+# rebuild_match_scores grows faster than the user count (about 9 s at 2k
+# users and 90 s at 10k), so larger scales are seeded without scores
+SCORES_MAX_SCALE = 20_000
+
+
+def parse_scale(text):
+    text = text.strip().lower()
+    if text and text[-1] in SUFFIXES:
+        return int(float(text[:-1]) * SUFFIXES[text[-1]])
+    return int(text)
+
+
+class Command(BaseCommand):
+    help = 'Benchmark the API hot paths on seeded databases and write the results as JSON'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--scales', default='10k', help='Comma-separated user counts, e.g. 10k,100k,1m')
+        parser.add_argument('--iterations', type=int, default=20, help='Timed calls per benchmark (at least 1)')
+        parser.add_argument('--seed', type=int, default=1)
+        parser.add_argument('--data-dir', default=os.path.join(tempfile.gettempdir(), 'mentormatch-bench'),
+                            help='Where seeded databases are kept')
+        parser.add_argument('--no-scores', action='store_true',
+                            help='Seed without precomputed MatchScore rows (local decks then take the fallback path)')
+        parser.add_argument('--scores-up-to', type=parse_scale, default=SCORES_MAX_SCALE,
+                            help='Only seed MatchScore rows at scales up to this many users (default 20k)')
+        parser.add_argument('--output', help='Write the JSON results here instead of stdout')
+        parser.add_argument('--compare', help='Previous results file to compare p50 latencies against')
+
+    def handle(self, *args, **options):
+        try:
+            scales = [parse_scale(s) for s in options['scales'].split(',')]
+        except ValueError:
+            raise CommandError(f"Invalid --scales: {options['scales']}")
+        if options['iterations'] < 1:
+            raise CommandError('--iterations must be at least 1.')
+        os.makedirs(options['data_dir'], exist_ok=True)
+        connection = connections['default']
+        if connection.vendor != 'sqlite':
+            raise CommandError('The benchmark seeds throwaway SQLite databases; run it with the SQLite settings.')
+        original_name = connection.settings_dict['NAME']
+
+        report = {
+            'commit': _git_commit(),
+            'python': platform.python_version(),
+            'django': django.get_version(),
+            'sqlite': sqlite3.sqlite_version,
+            'seed': options['seed'],
+            'iterations': options['iterations'],
+            'results': [],
+        }
+        try:
+            for scale in scales:
+                with_scores = not options['no_scores'] and scale <= options['scores_up_to']
+                template = seeded_database(scale, options['seed'], options['data_dir'], with_scores, self.stderr)
+                working = template.replace('.sqlite3', '-run.sqlite3')
+                use_database(None)
+                shutil.copyfile(template, working)
+                use_database(working)
+                # The template may predate later migrations
+                call_command('migrate', verbosity=0)
+                self.stderr.write(f"Benchmarking {scale} users ({'with' if with_scores else 'without'} match scores)...")
+                for name, fn in self._benchmarks(random.Random(options['seed'])):
+                    # profile_update queues a background score refresh; SQLite lets only one writer
+                    # in, so drain it between calls (untimed) rather than race the next write
+                    settle = wait_for_score_refreshes if name == 'profile_update' else None
+                    result = measure(fn, options['iterations'], settle)
+                    result.update(scale=scale, benchmark=name, match_scores=with_scores)
+                    report['results'].append(result)
+                    self.stderr.write(f"  {name:<20} p50 {result['p50_ms']:8.2f} ms  "
+                                      f"{result['queries']:3d} queries  peak {result['peak_kib']:9.1f} KiB")
+                # profile_update queues score refreshes; let them finish on this copy
+                wait_for_score_refreshes()
+                use_database(None)
+                os.remove(working)
+        finally:
+            use_database(original_name)
+
+        output = json.dumps(report, indent=2)
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                f.write(output + '\n')
+        else:
+            self.stdout.write(output)
+        if options['compare']:
+            self._compare(report, options['compare'])
+
+    def _benchmarks(self, rng):
+        """(name, callable) pairs; each callable runs one request or update."""
+        students = list(User.objects.filter(role='student', country='USA').values_list('id', flat=True)[:500])
+        professionals = list(User.objects.filter(role='professional', country='USA').values_list('id', flat=True)[:2000])
+        matches = list(Match.objects.exclude(last_message_at=None).values_list('id', 'user1_id')[:500])
+        skills = list(Skill.objects.values_list('name', flat=True))
+        if not students or not professionals or not matches:
+            raise CommandError('The seeded database has no students, professionals or conversations.')
+        users = {u.id: u for u in User.objects.filter(id__in=students + [user_id for _, user_id in matches])}
+
+        def client(user_id):
+            c = APIClient(SERVER_NAME='localhost')
+            c.force_authenticate(users[user_id])
+            return c
+
+        def get(path_for):
+            def run():
+                user_id, path = path_for()
+                response = client(user_id).get(path)
+                assert response.status_code == 200, (path, response.status_code)
+            return run
+
+        def pick_match():
+            return rng.choice(matches)
+
+        def messages_page():
+            match_id, user_id = pick_match()
+            return user_id, f'/api/messages/{match_id}/?limit=50'
+
+        def swipe():
+            response = client(rng.choice(students)).post(
+                '/api/swipe/', {'to_user': rng.choice(professionals), 'liked': rng.random() < 0.5}, format='json',
+            )
+            assert response.status_code in (200, 201), response.status_code
+
+        def send_message():
+            match_id, user_id = pick_match()
+            response = client(user_id).post(f'/api/messages/{match_id}/', {'match': match_id, 'content': 'benchmark'}, format='json')
+            assert response.status_code == 201, response.status_code
+
+        def profile_update():
+            user = users[rng.choice(students)]
+            serializer = ProfileUpdateSerializer(user, data={
+                'skills_offered_ids': rng.sample(skills, 2), 'skills_needed_ids': rng.sample(skills, 3),
+            }, partial=True)
+            serializer.is_valid(raise_exception=True)
+            serializer.save()
+
+        return [
+            ('potential_local', get(lambda: (rng.choice(students), '/api/potential/?limit=20'))),
+            ('potential_global', get(lambda: (rng.choice(students), '/api/potential/?global=1&limit=20'))),
+            ('swipe', swipe),
+            ('matches', get(lambda: (pick_match()[1], '/api/matches/'))),
+            ('messages_page', get(messages_page)),
+            ('messages_send', send_message),
+            ('profile_update', profile_update),
+        ]
+
+    def _compare(self, report, path):
+        with open(path) as f:
+            previous = {(r['scale'], r['benchmark']): r for r in json.load(f)['results']}
+        self.stderr.write(f'\nChange in p50 against {path}:')
+        for r in report['results']:
+            old = previous.get((r['scale'], r['benchmark']))
+            if old and old['p50_ms']:
+                change = (r['p50_ms'] - old['p50_ms']) / old['p50_ms'] * 100
+                self.stderr.write(f"  {r['scale']:>8} {r['benchmark']:<20} {old['p50_ms']:8.2f} -> {r['p50_ms']:8.2f} ms ({change:+.0f}%)")
+
+
+def use_database(name):
+    """Point the default connection at another SQLite file (None just closes it)."""
+    connection = connections['default']
+    connection.close()
+    if name is not None:
+        connection.settings_dict['NAME'] = name
+    # Cached ids and profiles belong to the previous database
+    vocabulary.clear()
+    cache.clear()
+
+
+def seeded_database(scale, seed, data_dir, with_scores=True, stderr=None):
+    """Path of the template database for `scale` users, seeding it on first use."""
+    template = os.path.join(data_dir, f"bench-{scale}-seed{seed}{'' if with_scores else '-noscores'}.sqlite3")
+    if os.path.exists(template):
+        return template
+    if stderr:
+        stderr.write(f'Seeding {scale} users into {template}...')
+    use_database(template)
+    started = time.perf_counter()
+    call_command('migrate', verbosity=0)
+    professionals = int(scale * PROFESSIONAL_SHARE)
+    args = [
+        '--students', str(scale - professionals), '--professionals', str(professionals),
+        '--seed', str(seed), '--output', '', '--chunk-size', '10000',
+    ]
+    if not with_scores:
+        args.append('--no-scores')
+    call_command('populate_users', *args, stdout=open(os.devnull, 'w'))
+    if stderr:
+        stderr.write(f'  seeded in {time.perf_counter() - started:.1f}s')
+    return template
+
+
+def measure(fn, iterations, settle=None):
+    """Latency percentiles, queries per call and peak traced memory of `fn`.
+
+    `settle`, if given, runs untimed after every call.
+    """
+    settle = settle or (lambda: None)
+    fn()  # Warm caches and lazy imports so the first timed call is not an outlier
+    settle()
+    timings, queries, sql_seconds = [], [], []
+    for _ in range(iterations):
+        with QueryCounter() as counter:
+            started = time.perf_counter()
+            fn()
+            timings.append(time.perf_counter() - started)
+        settle()
+        queries.append(counter.count)
+        sql_seconds.append(counter.seconds)
+    # tracemalloc slows everything down, so memory is measured on separate calls
+    tracemalloc.start()
+    try:
+        peak = 0
+        for _ in range(min(iterations, 3)):
+            tracemalloc.reset_peak()
+            fn()
+            peak = max(peak, tracemalloc.get_traced_memory()[1])
+            settle()
+    finally:
+        tracemalloc.stop()
+    timings.sort()
+    return {
+        'iterations': iterations,
+        'p50_ms': round(statistics.median(timings) * 1000, 3),
+        'p95_ms': round(timings[min(len(timings) - 1, int(len(timings) * 0.95))] * 1000, 3),
+        'mean_ms': round(statistics.fmean(timings) * 1000, 3),
+        'queries': max(queries),
+        'sql_ms': round(statistics.median(sql_seconds) * 1000, 3),
+        'peak_kib': round(peak / 1024, 1),
+    }
+
+
+def _git_commit():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], cwd=settings.BASE_DIR,
+            capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
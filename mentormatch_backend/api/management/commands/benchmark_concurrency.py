@@ -0,0 +1,203 @@
+import json
+import multiprocessing
+import os
+import random
+import shutil
+import sqlite3
+import statistics
+import tempfile
+import time
+from collections import Counter, defaultdict
+
+from django.conf import settings
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import close_old_connections, connections
+from rest_framework.test import APIClient
+from api.models import User, Match
+
+from .benchmark_api import SCORES_MAX_SCALE, parse_scale, seeded_database, use_database
+
+# Mixed read/write load against a seeded SQLite database, once per tuning
+# profile (settings.SQLITE_PROFILES). Every worker is a separate process,
+# like the workers of a WSGI server, and goes through the full request
+# stack; connections are closed or kept between requests exactly as
+# request_started/request_finished would under the profile's CONN_MAX_AGE.
+
+READS = ('potential', 'inbox', 'messages_page')
+WRITES = ('swipe', 'message_send')
+
+
+class Command(BaseCommand):
+    help = 'Measure read and write latency and errors under concurrent load for each SQLite tuning profile'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--profiles', default=','.join(settings.SQLITE_PROFILES),
+                            help='Comma-separated names from SQLITE_PROFILES')
+        parser.add_argument('--scale', default='10k', help='Users in the seeded database, e.g. 10k')
+        parser.add_argument('--readers', type=int, default=6, help='Reading worker processes')
+        parser.add_argument('--writers', type=int, default=4, help='Writing worker processes')
+        parser.add_argument('--duration', type=float, default=10, help='Seconds of load per profile')
+        parser.add_argument('--seed', type=int, default=1)
+        parser.add_argument('--data-dir', default=os.path.join(tempfile.gettempdir(), 'mentormatch-bench'),
+                            help='Where seeded databases are kept (shared with benchmark_api)')
+        parser.add_argument('--output', help='Write the JSON results here as well')
+
+    def handle(self, *args, **options):
+        profiles = [p.strip() for p in options['profiles'].split(',') if p.strip()]
+        unknown = [p for p in profiles if p not in settings.SQLITE_PROFILES]
+        if unknown:
+            raise CommandError(f"Unknown profile(s): {', '.join(unknown)}")
+        try:
+            scale = parse_scale(options['scale'])
+        except ValueError:
+            raise CommandError(f"Invalid --scale: {options['scale']}")
+        connection = connections['default']
+        if connection.vendor != 'sqlite':
+            raise CommandError('This benchmark compares SQLite profiles; run it with the SQLite settings.')
+        os.makedirs(options['data_dir'], exist_ok=True)
+        settings_dict = connection.settings_dict
+        original = {key: settings_dict.get(key) for key in ('NAME', 'OPTIONS', 'CONN_MAX_AGE', 'CONN_HEALTH_CHECKS')}
+
+        with_scores = scale <= SCORES_MAX_SCALE
+        report = {'scale': scale, 'readers': options['readers'], 'writers': options['writers'],
+                  'duration': options['duration'], 'sqlite': sqlite3.sqlite_version, 'match_scores': with_scores, 'results': []}
+        try:
+            template = seeded_database(scale, options['seed'], options['data_dir'], with_scores, self.stderr)
+            for profile in profiles:
+                working = template.replace('.sqlite3', f'-{profile}.sqlite3')
+                use_database(None)
+                _copy_database(template, working)
+                _apply_profile(settings_dict, profile)
+                use_database(working)
+                call_command('migrate', verbosity=0)
+                self.stderr.write(f'Profile {profile}: {options["readers"]} readers, '
+                                  f'{options["writers"]} writers for {options["duration"]:g}s...')
+                result = self._run(options)
+                result['profile'] = profile
+                report['results'].append(result)
+                self._print(result)
+                use_database(None)
+                for suffix in ('', '-wal', '-shm'):
+                    if os.path.exists(working + suffix):
+                        os.remove(working + suffix)
+        finally:
+            use_database(None)
+            settings_dict.update(original)
+
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                f.write(json.dumps(report, indent=2) + '\n')
+
+    def _run(self, options):
+        students = list(User.objects.filter(role='student', country='USA').values_list('id', flat=True)[:500])
+        professionals = list(User.objects.filter(role='professional', country='USA').values_list('id', flat=True)[:2000])
+        matches = list(Match.objects.exclude(last_message_at=None).values_list('id', 'user1_id')[:500])
+        if not students or not professionals or not matches:
+            raise CommandError('The seeded database has no students, professionals or conversations.')
+        # Children must open their own connections, never share the parent's
+        connections.close_all()
+        ids = {'students': students, 'professionals': professionals, 'matches': matches}
+        jobs = [('read', options['seed'] * 1000 + i) for i in range(options['readers'])]
+        jobs += [('write', options['seed'] * 1000 + 500 + i) for i in range(options['writers'])]
+        start_at = time.time() + 1  # Let every worker start before the clock runs
+        with multiprocessing.get_context('fork').Pool(len(jobs)) as pool:
+            outcomes = pool.starmap(_worker, [(kind, seed, ids, start_at, options['duration']) for kind, seed in jobs])
+
+        latencies, errors = defaultdict(list), Counter()
+        for worker_latencies, worker_errors in outcomes:
+            for op, values in worker_latencies.items():
+                latencies[op].extend(values)
+            errors.update(worker_errors)
+        operations = {}
+        for op in READS + WRITES:
+            values = sorted(latencies.get(op, []))
+            operations[op] = {
+                'count': len(values),
+                'per_second': round(len(values) / options['duration'], 1),
+                'p50_ms': _percentile(values, 0.5),
+                'p95_ms': _percentile(values, 0.95),
+                'p99_ms': _percentile(values, 0.99),
+            }
+        return {'operations': operations, 'errors': dict(errors)}
+
+    def _print(self, result):
+        for op, stats in result['operations'].items():
+            self.stderr.write(f"  {op:<15} {stats['per_second']:8.1f}/s  p50 {stats['p50_ms'] or 0:8.2f} ms  "
+                              f"p95 {stats['p95_ms'] or 0:8.2f} ms  p99 {stats['p99_ms'] or 0:8.2f} ms")
+        for error, count in result['errors'].items():
+            self.stderr.write(self.style.WARNING(f'  {count} x {error}'))
+        if not result['errors']:
+            self.stderr.write('  no errors')
+
+
+def _copy_database(template, working):
+    """Copy the template and put the copy back in rollback-journal mode."""
+    shutil.copyfile(template, working)
+    with sqlite3.connect(working) as db:
+        db.execute('PRAGMA journal_mode=DELETE')
+    db.close()
+
+
+def _apply_profile(settings_dict, profile):
+    settings_dict.update({'OPTIONS': {}, 'CONN_MAX_AGE': 0, 'CONN_HEALTH_CHECKS': False})
+    settings_dict.update(settings.SQLITE_PROFILES[profile])
+
+
+def _percentile(values, fraction):
+    if not values:
+        return None
+    if fraction == 0.5:
+        return round(statistics.median(values) * 1000, 3)
+    return round(values[min(len(values) - 1, int(len(values) * fraction))] * 1000, 3)
+
+
+def _worker(kind, seed, ids, start_at, duration):
+    """Run one kind of traffic until the deadline; returns latencies and error counts."""
+    rng = random.Random(seed)
+    students, professionals, matches = ids['students'], ids['professionals'], ids['matches']
+    users = {u.id: u for u in User.objects.filter(id__in=students + [user_id for _, user_id in matches])}
+    close_old_connections()
+    clients = {}
+
+    def client(user_id):
+        if user_id not in clients:
+            clients[user_id] = APIClient(SERVER_NAME='localhost')
+            clients[user_id].force_authenticate(users[user_id])
+        return clients[user_id]
+
+    def request(op):
+        if op == 'potential':
+            return client(rng.choice(students)).get('/api/potential/?limit=20')
+        if op == 'inbox':
+            return client(rng.choice(matches)[1]).get('/api/inbox/')
+        if op == 'messages_page':
+            match_id, user_id = rng.choice(matches)
+            return client(user_id).get(f'/api/messages/{match_id}/?limit=50')
+        if op == 'swipe':
+            return client(rng.choice(students)).post(
+                '/api/swipe/', {'to_user': rng.choice(professionals), 'liked': rng.random() < 0.5}, format='json',
+            )
+        match_id, user_id = rng.choice(matches)
+        return client(user_id).post(f'/api/messages/{match_id}/', {'match': match_id, 'content': 'load'}, format='json')
+
+    ops = READS if kind == 'read' else WRITES
+    latencies, errors = defaultdict(list), Counter()
+    time.sleep(max(0, start_at - time.time()))
+    deadline = start_at + duration
+    while time.time() < deadline:
+        op = rng.choice(ops)
+        started = time.perf_counter()
+        try:
+            response = request(op)
+            if response.status_code >= 400:
+                errors[f'{op}: HTTP {response.status_code}'] += 1
+            else:
+                latencies[op].append(time.perf_counter() - started)
+        except Exception as exc:
+            errors[f'{op}: {type(exc).__name__}: {exc}'] += 1
+        finally:
+            # What request_finished does: close, or keep under CONN_MAX_AGE
+            close_old_connections()
+    connections.close_all()
+    return dict(latencies), dict(errors)
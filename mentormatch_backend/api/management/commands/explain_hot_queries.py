@@ -0,0 +1,52 @@
+import re
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.db.models import Q
+from api.matching import candidate_queryset
+from api.models import User, Swipe, Match, Message, MatchScore
+
+# SQLite: "SCAN api_user" is a full table scan, "SCAN x USING [COVERING] INDEX"
+# is an index scan. PostgreSQL: "Seq Scan on api_user".
+FULL_SCAN = re.compile(r'\bSCAN (?!.*\bUSING\b)(?!SUBQUERY|CONSTANT)|\bSeq Scan\b')
+
+
+def hot_queries():
+    """(name, queryset) for the queries behind the busiest endpoints."""
+    # Unsaved users are enough to build the SQL; EXPLAIN does not need data
+    student = User(id=1, role='student', city='Austin', state='TX', country='USA')
+    professional = User(id=2, role='professional', city='Austin', state='TX', country='USA')
+    return [
+        ('potential: student deck', candidate_queryset(student)),
+        ('potential: professional deck', candidate_queryset(professional)),
+        ('potential: stored ranking',
+         MatchScore.objects.filter(user=student).order_by('-score', 'candidate_id')[:21]),
+        ('potential: skill masks',
+         User.skills_offered.through.objects.filter(user_id__in=[1, 2]).values_list('user_id', 'skill__name')),
+        ('swipe: reciprocal like', Swipe.objects.filter(from_user_id__in=[2], to_user=student, liked=True)),
+        ('matches: list', Match.objects.filter(Q(user1=student) | Q(user2=student)).order_by('-timestamp')),
+        ('messages: newest page', Message.objects.filter(match_id=1).order_by('-timestamp', '-id')[:51]),
+    ]
+
+
+class Command(BaseCommand):
+    help = 'EXPLAIN the hot API queries and report whether each one uses an index'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--verbose-plans', action='store_true', help='Print the full plan of every query')
+
+    def handle(self, *args, **options):
+        full_scans = []
+        for name, qs in hot_queries():
+            plan = qs.explain()
+            scans = [line.strip(' |-`') for line in plan.splitlines() if FULL_SCAN.search(line)]
+            if scans:
+                full_scans.append(name)
+                self.stdout.write(self.style.WARNING(f'FULL SCAN  {name}: {"; ".join(scans)}'))
+            else:
+                self.stdout.write(self.style.SUCCESS(f'indexed    {name}'))
+            if options['verbose_plans']:
+                self.stdout.write('\n'.join(f'    {line}' for line in plan.splitlines()))
+        self.stdout.write(f'\n{connection.vendor}: {len(full_scans)} of {len(hot_queries())} queries scan a whole table.')
+        if full_scans:
+            raise CommandError('Full table scans in: ' + ', '.join(full_scans))
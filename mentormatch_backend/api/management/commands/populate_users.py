@@ -1,203 +1,300 @@
-from django.core.management.base import BaseCommand
-from api.models import User, Skill
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import OuterRef, Subquery
+from api.models import User, Skill, Swipe, Match, Message
+from api.matching import rebuild_match_scores
+from api.vocabulary import resolve
 import random
+from collections import defaultdict
 from datetime import date, timedelta
 import csv
 
+tech_skills = ['Python', 'JavaScript', 'Java', 'React', 'Django', 'Node.js', 'SQL',
+               'Machine Learning', 'Data Science', 'Cloud Computing', 'AWS', 'Docker',
+               'Kubernetes', 'Go', 'Rust', 'TypeScript', 'Vue.js', 'Angular']
+
+business_skills = ['Project Management', 'Marketing', 'Sales', 'Leadership',
+                   'Business Strategy', 'Finance', 'Accounting', 'HR Management',
+                   'Product Management', 'Public Speaking', 'Negotiation']
+
+creative_skills = ['Graphic Design', 'UI/UX Design', 'Video Editing', 'Photography',
+                   'Content Writing', 'Copywriting', 'Animation', '3D Modeling']
+
+soft_skills = ['Communication', 'Team Collaboration', 'Problem Solving',
+               'Critical Thinking', 'Time Management', 'Adaptability']
+
+all_skills = tech_skills + business_skills + creative_skills + soft_skills
+
+major_cities = [
+    ('New York', 'NY', 'USA'),
+    ('San Francisco', 'CA', 'USA'),
+    ('Los Angeles', 'CA', 'USA'),
+    ('Boston', 'MA', 'USA'),
+    ('Seattle', 'WA', 'USA'),
+    ('Chicago', 'IL', 'USA'),
+    ('Austin', 'TX', 'USA'),
+    ('Denver', 'CO', 'USA'),
+]
+
+remote_locations = [
+    ('Tokyo', '', 'Japan'),
+    ('London', '', 'UK'),
+    ('Berlin', '', 'Germany'),
+    ('Sydney', '', 'Australia'),
+]
+
+first_names_male = ['James', 'John', 'Robert', 'Michael', 'William', 'David', 'Richard',
+                    'Joseph', 'Thomas', 'Christopher', 'Daniel', 'Matthew', 'Anthony',
+                    'Mark', 'Donald', 'Steven', 'Paul', 'Andrew', 'Joshua', 'Kenneth']
+
+first_names_female = ['Mary', 'Patricia', 'Jennifer', 'Linda', 'Elizabeth', 'Barbara',
+                      'Susan', 'Jessica', 'Sarah', 'Karen', 'Nancy', 'Lisa', 'Betty',
+                      'Margaret', 'Sandra', 'Ashley', 'Kimberly', 'Emily', 'Donna', 'Michelle']
+
+last_names = ['Smith', 'Johnson', 'Williams', 'Brown', 'Jones', 'Garcia', 'Miller',
+              'Davis', 'Rodriguez', 'Martinez', 'Hernandez', 'Lopez', 'Gonzalez',
+              'Wilson', 'Anderson', 'Thomas', 'Taylor', 'Moore', 'Jackson', 'Martin',
+              'Lee', 'Thompson', 'White', 'Harris', 'Sanchez', 'Clark', 'Ramirez']
+
+openers = ['Hi! Thanks for matching.', 'Hello, nice to meet you!', 'Hey, when are you free for a call?',
+           'Could you help me with a project?', 'Happy to help, what are you working on?',
+           'Sounds great, talk soon.', 'Does Thursday work for you?', 'Thanks, that was really useful!']
+
+# Seeded runs count ages from this date, so their output is the same any day
+SEEDED_TODAY = date(2025, 1, 1)
+
+# Generated accounts, and only those, are replaced on every run
+GENERATED_USERNAME = r'^(student|prof)[0-9]+$'
+CSV_FIELDS = ['username', 'password', 'email', 'role', 'name', 'location', 'age', 'verified']
+
+
 class Command(BaseCommand):
-    help = 'Populate database with 50 students and 50 professionals'
+    help = 'Populate the database with synthetic students, professionals, swipes, matches and messages'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--students', type=int, default=50)
+        parser.add_argument('--professionals', type=int, default=50)
+        parser.add_argument('--seed', type=int, help='Random seed; the same seed generates the same data')
+        parser.add_argument('--output', default=str(settings.BASE_DIR.parent / 'test_user_credentials.csv'),
+                            help="Credentials CSV path ('' to skip)")
+        parser.add_argument('--password', default='pass', help='Password of every generated user')
+        parser.add_argument('--swipes-per-student', type=int, default=5)
+        parser.add_argument('--like-rate', type=float, default=0.6, help='Share of student swipes that are likes')
+        parser.add_argument('--match-rate', type=float, default=0.5, help='Share of likes the professional returns')
+        parser.add_argument('--messages-per-match', type=int, default=6, help='Average messages per match')
+        parser.add_argument('--chunk-size', type=int, default=5000, help='Rows per transaction')
+        parser.add_argument('--no-scores', action='store_true', help='Skip rebuilding the precomputed match scores')
+        parser.add_argument('--today', type=date.fromisoformat,
+                            help=f'Date (YYYY-MM-DD) ages are counted from; default {SEEDED_TODAY} with --seed, else today')
+
+    def handle(self, *args, **options):
+        if options['students'] < 0 or options['professionals'] < 0 or options['chunk_size'] < 1:
+            raise CommandError('Counts must be positive.')
+        self.rng = random.Random(options['seed'])
+        self.today = options['today'] or (SEEDED_TODAY if options['seed'] is not None else date.today())
+        self.chunk_size = options['chunk_size']
+        # Hashing is deliberately slow, so do it once for everyone
+        self.password_hash = make_password(options['password'])
 
-    def handle(self, *args, **kwargs):
         self.stdout.write('Clearing existing test users...')
-        User.objects.filter(username__startswith='student').delete()
-        User.objects.filter(username__startswith='prof').delete()
+        self.clear()
         self.stdout.write('Cleared existing users.')
 
-        tech_skills = ['Python', 'JavaScript', 'Java', 'React', 'Django', 'Node.js', 'SQL', 
-                       'Machine Learning', 'Data Science', 'Cloud Computing', 'AWS', 'Docker',
-                       'Kubernetes', 'Go', 'Rust', 'TypeScript', 'Vue.js', 'Angular']
-        
-        business_skills = ['Project Management', 'Marketing', 'Sales', 'Leadership', 
-                          'Business Strategy', 'Finance', 'Accounting', 'HR Management',
-                          'Product Management', 'Public Speaking', 'Negotiation']
-        
-        creative_skills = ['Graphic Design', 'UI/UX Design', 'Video Editing', 'Photography',
-                          'Content Writing', 'Copywriting', 'Animation', '3D Modeling']
-        
-        soft_skills = ['Communication', 'Team Collaboration', 'Problem Solving', 
-                      'Critical Thinking', 'Time Management', 'Adaptability']
-        
-        all_skills = tech_skills + business_skills + creative_skills + soft_skills
-
-        for skill_name in all_skills:
-            Skill.objects.get_or_create(name=skill_name)
-
-        major_cities = [
-            ('New York', 'NY', 'USA'),
-            ('San Francisco', 'CA', 'USA'),
-            ('Los Angeles', 'CA', 'USA'),
-            ('Boston', 'MA', 'USA'),
-            ('Seattle', 'WA', 'USA'),
-            ('Chicago', 'IL', 'USA'),
-            ('Austin', 'TX', 'USA'),
-            ('Denver', 'CO', 'USA'),
-        ]
-        
-        remote_locations = [
-            ('Tokyo', '', 'Japan'),
-            ('London', '', 'UK'),
-            ('Berlin', '', 'Germany'),
-            ('Sydney', '', 'Australia'),
-        ]
-
-        first_names_male = ['James', 'John', 'Robert', 'Michael', 'William', 'David', 'Richard', 
-                           'Joseph', 'Thomas', 'Christopher', 'Daniel', 'Matthew', 'Anthony',
-                           'Mark', 'Donald', 'Steven', 'Paul', 'Andrew', 'Joshua', 'Kenneth']
-        
-        first_names_female = ['Mary', 'Patricia', 'Jennifer', 'Linda', 'Elizabeth', 'Barbara',
-                             'Susan', 'Jessica', 'Sarah', 'Karen', 'Nancy', 'Lisa', 'Betty',
-                             'Margaret', 'Sandra', 'Ashley', 'Kimberly', 'Emily', 'Donna', 'Michelle']
-        
-        last_names = ['Smith', 'Johnson', 'Williams', 'Brown', 'Jones', 'Garcia', 'Miller',
-                     'Davis', 'Rodriguez', 'Martinez', 'Hernandez', 'Lopez', 'Gonzalez',
-                     'Wilson', 'Anderson', 'Thomas', 'Taylor', 'Moore', 'Jackson', 'Martin',
-                     'Lee', 'Thompson', 'White', 'Harris', 'Sanchez', 'Clark', 'Ramirez']
-
-        credentials = []
-
-        self.stdout.write('Creating 50 students...')
-        for i in range(50):
-            is_female = random.choice([True, False])
-            first_name = random.choice(first_names_female if is_female else first_names_male)
-            last_name = random.choice(last_names)
-            username = f'student{i+1}'
-            password = f'pass{i+1}'
-            email = f'{username}@example.com'
-            
-            age = random.randint(18, 25)
-            birth_date = date.today() - timedelta(days=age*365 + random.randint(0, 364))
-            
-            if random.random() < 0.9:
-                city, state, country = random.choice(major_cities)
-            else:
-                city, state, country = random.choice(remote_locations)
-
-            user = User.objects.create_user(
-                username=username,
-                email=email,
-                password=password,
-                role='student',
-                first_name=first_name,
-                last_name=last_name,
-                date_of_birth=birth_date,
-                city=city,
-                state=state,
-                country=country,
-                bio=f"I'm a {age}-year-old student passionate about learning and growing. Looking for mentorship to advance my career."
-            )
-            
-            num_needed = random.randint(2, 5)
-            needed_skills = random.sample(all_skills, num_needed)
-            for skill_name in needed_skills:
-                skill = Skill.objects.get(name=skill_name)
-                user.skills_needed.add(skill)
-            
-            num_offered = random.randint(1, 3)
-            available_for_offer = [s for s in all_skills if s not in needed_skills]
-            offered_skills = random.sample(available_for_offer, min(num_offered, len(available_for_offer)))
-            for skill_name in offered_skills:
-                skill = Skill.objects.get(name=skill_name)
-                user.skills_offered.add(skill)
-            
-            credentials.append({
-                'username': username,
-                'password': password,
-                'email': email,
-                'role': 'student',
-                'name': f'{first_name} {last_name}',
-                'location': f'{city}, {state + ", " if state else ""}{country}',
-                'age': age
-            })
-            
-            if (i + 1) % 10 == 0:
-                self.stdout.write(f'Created {i+1} students...')
-
-        self.stdout.write('Creating 50 professionals...')
-        for i in range(50):
-            is_female = random.choice([True, False])
-            first_name = random.choice(first_names_female if is_female else first_names_male)
-            last_name = random.choice(last_names)
-            username = f'prof{i+1}'
-            password = f'pass{i+1}'
-            email = f'{username}@example.com'
-            
-            age = random.randint(28, 55)
-            birth_date = date.today() - timedelta(days=age*365 + random.randint(0, 364))
-
-            if random.random() < 0.85:
-                city, state, country = random.choice(major_cities)
-            else:
-                city, state, country = random.choice(remote_locations)
-
-            is_verified = random.random() < 0.7
-            
-            user = User.objects.create_user(
-                username=username,
-                email=email,
-                password=password,
-                role='professional',
-                first_name=first_name,
-                last_name=last_name,
-                date_of_birth=birth_date,
-                city=city,
-                state=state,
-                country=country,
-                is_verified=is_verified,
-                bio=f"Experienced professional with {age-22} years in the industry. Happy to mentor and share knowledge."
-            )
-            
-            num_offered = random.randint(3, 7)
-            offered_skills = random.sample(all_skills, num_offered)
-            for skill_name in offered_skills:
-                skill = Skill.objects.get(name=skill_name)
-                user.skills_offered.add(skill)
-
-            num_needed = random.randint(1, 3)
-
-            available_for_need = [s for s in all_skills if s not in offered_skills]
-            needed_skills = random.sample(available_for_need, min(num_needed, len(available_for_need)))
-            for skill_name in needed_skills:
-                skill = Skill.objects.get(name=skill_name)
-                user.skills_needed.add(skill)
-            
-            credentials.append({
-                'username': username,
-                'password': password,
-                'email': email,
-                'role': 'professional',
-                'name': f'{first_name} {last_name}',
-                'location': f'{city}, {state + ", " if state else ""}{country}',
-                'age': age,
-                'verified': 'Yes' if is_verified else 'No'
-            })
-            
-            if (i + 1) % 10 == 0:
-                self.stdout.write(f'Created {i+1} professionals...')
-
-        csv_path = '/Users/lennonrozo/Desktop/mentormatch/test_user_credentials.csv'
-        with open(csv_path, 'w', newline='') as csvfile:
-            fieldnames = ['username', 'password', 'email', 'role', 'name', 'location', 'age', 'verified']
-            writer = csv.DictWriter(csvfile, fieldnames=fieldnames)
-            
-            writer.writeheader()
-            for cred in credentials:
-                writer.writerow(cred)
-
-        self.stdout.write(self.style.SUCCESS(f'\nSuccessfully created 100 users!'))
-        self.stdout.write(self.style.SUCCESS(f'Credentials saved to: {csv_path}'))
+        self.skill_ids = dict(zip(all_skills, resolve(Skill, all_skills)))
+        self.csv_file = self.writer = None
+        if options['output']:
+            self.csv_file = open(options['output'], 'w', newline='')
+            self.writer = csv.DictWriter(self.csv_file, fieldnames=CSV_FIELDS)
+            self.writer.writeheader()
+        try:
+            # Professionals first, so students' swipes can point at them
+            professionals = self.create_users('professional', options['professionals'], options['password'])
+            students = self.create_users('student', options['students'], options['password'])
+        finally:
+            if self.csv_file:
+                self.csv_file.close()
+
+        swipes, match_ids = self.create_swipes(students, professionals, options)
+        messages = self.create_messages(match_ids, options['messages_per_match'])
+
+        if not options['no_scores']:
+            self.stdout.write('Rebuilding match scores...')
+            rebuild_match_scores()
+
+        self.stdout.write(self.style.SUCCESS(
+            f"\nSuccessfully created {options['students'] + options['professionals']} users!"
+        ))
+        if options['output']:
+            self.stdout.write(self.style.SUCCESS(f"Credentials saved to: {options['output']}"))
         self.stdout.write('\nSummary:')
-        self.stdout.write(f'- 50 students created')
-        self.stdout.write(f'- 50 professionals created (70% verified)')
-        self.stdout.write(f'- Skills varied across tech, business, creative, and soft skills')
-        self.stdout.write(f'- Most users in major US cities, some international')
-        self.stdout.write(f'- Skill intersections created for matching')
+        self.stdout.write(f"- {options['students']} students created")
+        self.stdout.write(f"- {options['professionals']} professionals created (70% verified)")
+        self.stdout.write(f'- {swipes} swipes, {len(match_ids)} matches, {messages} messages')
+        self.stdout.write(f"- Password for every user: {options['password']}")
+
+    def clear(self):
+        ids = list(User.objects.filter(username__regex=GENERATED_USERNAME).values_list('id', flat=True))
+        for start in range(0, len(ids), self.chunk_size):
+            with transaction.atomic():
+                User.objects.filter(id__in=ids[start:start + self.chunk_size]).delete()
+
+    def create_users(self, role, count, password):
+        """Insert `count` users of `role` a chunk at a time; returns {country: [ids]}."""
+        self.stdout.write(f'Creating {count} {role}s...')
+        by_country = defaultdict(list)
+        prefix = 'student' if role == 'student' else 'prof'
+        for start in range(0, count, self.chunk_size):
+            users, skills, rows = [], [], []
+            for i in range(start, min(start + self.chunk_size, count)):
+                user, offered, needed, row = self.fake_user(role, f'{prefix}{i+1}', password)
+                users.append(user)
+                skills.append((offered, needed))
+                rows.append(row)
+            with transaction.atomic():
+                User.objects.bulk_create(users)
+                offered_through, needed_through = User.skills_offered.through, User.skills_needed.through
+                offered_through.objects.bulk_create([
+                    offered_through(user_id=user.id, skill_id=self.skill_ids[name])
+                    for user, (offered, _) in zip(users, skills) for name in offered
+                ])
+                needed_through.objects.bulk_create([
+                    needed_through(user_id=user.id, skill_id=self.skill_ids[name])
+                    for user, (_, needed) in zip(users, skills) for name in needed
+                ])
+            for user in users:
+                by_country[user.country].append(user.id)
+            if self.writer:
+                self.writer.writerows(rows)
+            self.stdout.write(f'Created {start + len(users)} {role}s...')
+        return by_country
+
+    def fake_user(self, role, username, password):
+        rng = self.rng
+        is_female = rng.choice([True, False])
+        first_name = rng.choice(first_names_female if is_female else first_names_male)
+        last_name = rng.choice(last_names)
+        email = f'{username}@example.com'
+        student = role == 'student'
+
+        age = rng.randint(18, 25) if student else rng.randint(28, 55)
+        birth_date = self.today - timedelta(days=age*365 + rng.randint(0, 364))
+
+        if rng.random() < (0.9 if student else 0.85):
+            city, state, country = rng.choice(major_cities)
+        else:
+            city, state, country = rng.choice(remote_locations)
+
+        if student:
+            needed = rng.sample(all_skills, rng.randint(2, 5))
+            offered = rng.sample([s for s in all_skills if s not in needed], rng.randint(1, 3))
+            is_verified = False
+            bio = f"I'm a {age}-year-old student passionate about learning and growing. Looking for mentorship to advance my career."
+        else:
+            offered = rng.sample(all_skills, rng.randint(3, 7))
+            needed = rng.sample([s for s in all_skills if s not in offered], rng.randint(1, 3))
+            is_verified = rng.random() < 0.7
+            bio = f"Experienced professional with {age-22} years in the industry. Happy to mentor and share knowledge."
+
+        user = User(
+            username=username,
+            email=email,
+            password=self.password_hash,
+            role=role,
+            first_name=first_name,
+            last_name=last_name,
+            date_of_birth=birth_date,
+            city=city,
+            state=state,
+            country=country,
+            is_verified=is_verified,
+            bio=bio,
+        )
+        row = {
+            'username': username,
+            'password': password,
+            'email': email,
+            'role': role,
+            'name': f'{first_name} {last_name}',
+            'location': f'{city}, {state + ", " if state else ""}{country}',
+            'age': age,
+        }
+        if not student:
+            row['verified'] = 'Yes' if is_verified else 'No'
+        return user, offered, needed, row
+
+    def create_swipes(self, students, professionals, options):
+        """Students swipe on professionals in their country; some likes are returned.
+
+        Only students start swipes and professionals only answer likes, so
+        every (from, to) pair is generated at most once without tracking them.
+        """
+        rng = self.rng
+        per_student = options['swipes_per_student']
+        swipes, pairs, match_ids = [], [], []
+        total = 0
+
+        def flush():
+            nonlocal total
+            with transaction.atomic():
+                Swipe.objects.bulk_create(swipes)
+                matches = Match.objects.bulk_create([Match(user1_id=min(a, b), user2_id=max(a, b)) for a, b in pairs])
+            match_ids.extend(m.id for m in matches)
+            total += len(swipes)
+            swipes.clear()
+            pairs.clear()
+
+        if per_student <= 0:
+            return 0, match_ids
+        self.stdout.write('Creating swipes and matches...')
+        for country in sorted(students):
+            candidates = professionals.get(country, [])
+            if not candidates:
+                continue
+            for student_id in students[country]:
+                for professional_id in rng.sample(candidates, min(per_student, len(candidates))):
+                    liked = rng.random() < options['like_rate']
+                    swipes.append(Swipe(from_user_id=student_id, to_user_id=professional_id, liked=liked))
+                    if liked and rng.random() < options['match_rate']:
+                        swipes.append(Swipe(from_user_id=professional_id, to_user_id=student_id, liked=True))
+                        pairs.append((student_id, professional_id))
+                if len(swipes) >= self.chunk_size:
+                    flush()
+        if swipes:
+            flush()
+        return total, match_ids
+
+    def create_messages(self, match_ids, average):
+        """Write conversations for `match_ids` and fill in the matches' inbox fields."""
+        if average <= 0 or not match_ids:
+            return 0
+        self.stdout.write('Creating messages...')
+        rng = self.rng
+        total = 0
+        per_chunk = max(1, self.chunk_size // average)
+        for start in range(0, len(match_ids), per_chunk):
+            chunk = match_ids[start:start + per_chunk]
+            participants = Match.objects.filter(id__in=chunk).order_by('id').values_list('id', 'user1_id', 'user2_id')
+            messages, talking = [], []
+            for match_id, user1_id, user2_id in participants:
+                senders = (user1_id, user2_id) if rng.random() < 0.5 else (user2_id, user1_id)
+                count = rng.randint(0, 2 * average)
+                if count:
+                    talking.append(match_id)
+                for n in range(count):
+                    messages.append(Message(match_id=match_id, sender_id=senders[n % 2], content=rng.choice(openers)))
+            latest = Message.objects.filter(match=OuterRef('pk')).order_by('-timestamp', '-id')
+            with transaction.atomic():
+                Message.objects.bulk_create(messages)
+                # Same fields MessageListCreateView keeps up to date; seeded
+                # conversations start out read by both sides.
+                Match.objects.filter(id__in=talking).update(
+                    last_activity_at=Subquery(latest.values('timestamp')[:1]),
+                    last_message_at=Subquery(latest.values('timestamp')[:1]),
+                    last_message_preview=Subquery(latest.values('content')[:1]),
+                    user1_read_id=Subquery(latest.values('id')[:1]),
+                    user2_read_id=Subquery(latest.values('id')[:1]),
+                )
+            total += len(messages)
+        return total
@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand
+from api.media import file_hash, generate_variants
+from api.models import Media
+
+
+class Command(BaseCommand):
+    help = 'Generate thumbnails for media still pending (e.g. uploaded before the pipeline existed)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--retry-failed', action='store_true', help='Also retry media whose processing failed')
+
+    def handle(self, *args, **options):
+        if options['retry_failed']:
+            Media.objects.filter(processing_status='failed').update(processing_status='pending')
+        pending = Media.objects.filter(processing_status='pending').order_by('id')
+        done = 0
+        for media in pending.iterator():
+            if not media.content_hash:
+                try:
+                    with media.file.open('rb') as f:
+                        media.content_hash = file_hash(f)
+                except OSError as exc:
+                    self.stderr.write(f'media {media.id}: {exc}')
+                    Media.objects.filter(id=media.id).update(processing_status='failed')
+                    continue
+                Media.objects.filter(id=media.id).update(content_hash=media.content_hash)
+            generate_variants(media.id)
+            done += 1
+        self.stdout.write(self.style.SUCCESS(f'Processed {done} media.'))
@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+from api.purge import due_accounts, purge_due_accounts
+
+
+class Command(BaseCommand):
+    help = 'Delete accounts whose scheduled deletion is past the grace period, in small batches'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500, help='Rows deleted per transaction')
+        parser.add_argument('--pause', type=float, default=0, help='Seconds to sleep between batches')
+        parser.add_argument('--limit', type=int, help='Purge at most this many accounts')
+        parser.add_argument('--dry-run', action='store_true', help='Only list the accounts that are due')
+
+    def handle(self, *args, **options):
+        if options['dry_run']:
+            for user in due_accounts():
+                self.stdout.write(f'{user.username} (id {user.id}, scheduled {user.deletion_scheduled_at:%Y-%m-%d})')
+            return
+        purged = purge_due_accounts(
+            batch_size=options['batch_size'], pause=options['pause'], limit=options['limit'], stdout=self.stdout,
+        )
+        self.stdout.write(self.style.SUCCESS(f'Purged {purged} account(s).'))
@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+from api.matching import rebuild_match_scores
+
+
+class Command(BaseCommand):
+    help = 'Recompute the precomputed match scores (all countries, or the given ones)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('countries', nargs='*', help='Only rebuild these countries')
+
+    def handle(self, *args, **options):
+        rebuild_match_scores(options['countries'] or None, stdout=self.stdout)
+        self.stdout.write(self.style.SUCCESS('Match scores rebuilt.'))
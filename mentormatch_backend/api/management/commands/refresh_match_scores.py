@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+from api.matching import process_score_refreshes
+
+
+class Command(BaseCommand):
+    help = 'Refresh the match scores of users queued after profile or verification changes'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        done = process_score_refreshes(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'Refreshed the match scores of {done} user(s).'))
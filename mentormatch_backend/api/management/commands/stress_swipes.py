@@ -0,0 +1,84 @@
+import os
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, connections
+from api.models import User, Match
+from api.swipes import record_swipes
+from .benchmark_api import use_database
+
+PREFIX = 'stress_'
+
+
+class Command(BaseCommand):
+    help = 'Have pairs of users like each other concurrently and check that every pair gets exactly one match'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--pairs', type=int, default=200)
+        parser.add_argument('--threads', type=int, default=8)
+        parser.add_argument('--keep', action='store_true', help='Keep the generated users afterwards')
+        parser.add_argument('--in-place', action='store_true',
+                            help='Run against the configured database instead of a scratch SQLite file')
+
+    def handle(self, *args, **options):
+        if options['in_place']:
+            return self._run(options)
+        original = connections['default'].settings_dict['NAME']
+        scratch_dir = tempfile.mkdtemp(prefix='mentormatch-stress-')
+        scratch = os.path.join(scratch_dir, 'stress.sqlite3')
+        self.stdout.write(f'Using scratch database {scratch}')
+        use_database(scratch)
+        try:
+            call_command('migrate', verbosity=0)
+            self._run(options)
+        finally:
+            use_database(original)
+            if not options['keep']:
+                os.remove(scratch)
+                os.rmdir(scratch_dir)
+
+    def _run(self, options):
+        pairs, threads = options['pairs'], options['threads']
+        # Never delete accounts this run did not create
+        if User.objects.filter(username__startswith=PREFIX).exists():
+            raise CommandError(f'Users named {PREFIX}* already exist in this database; remove them first.')
+        User.objects.bulk_create(
+            [User(username=f'{PREFIX}s{i}', role='student') for i in range(pairs)]
+            + [User(username=f'{PREFIX}p{i}', role='professional') for i in range(pairs)]
+        )
+        users = {u.username: u for u in User.objects.filter(username__startswith=PREFIX)}
+        # Both directions of a pair are queued next to each other so they run at the same time
+        tasks = []
+        for i in range(pairs):
+            s, p = users[f'{PREFIX}s{i}'], users[f'{PREFIX}p{i}']
+            tasks += [(s, p.id), (p, s.id)]
+
+        errors = []
+
+        def swipe(task):
+            from_user, to_user_id = task
+            try:
+                record_swipes(from_user, [(to_user_id, True)])
+            except Exception as exc:
+                errors.append(exc)
+            finally:
+                connection.close()
+
+        self.stdout.write(f'Running {len(tasks)} swipes on {threads} threads...')
+        start = time.perf_counter()
+        with ThreadPoolExecutor(threads) as pool:
+            list(pool.map(swipe, tasks))
+        elapsed = time.perf_counter() - start
+
+        matches = Match.objects.filter(user1__username__startswith=PREFIX).count()
+        self.stdout.write(f'{matches}/{pairs} pairs matched in {elapsed:.2f}s ({len(tasks) / elapsed:.0f} swipes/s), {len(errors)} errors')
+        for exc in errors[:5]:
+            self.stdout.write(f'  {type(exc).__name__}: {exc}')
+        if not options['keep']:
+            User.objects.filter(username__startswith=PREFIX).delete()
+        if errors or matches != pairs:
+            raise CommandError('Lost matches or failed swipes under concurrency.')
+        self.stdout.write(self.style.SUCCESS('Every pair matched exactly once.'))
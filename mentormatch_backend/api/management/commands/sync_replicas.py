@@ -0,0 +1,37 @@
+import sqlite3
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+# Stand-in for real replication when trying read replicas locally: copies the
+# primary SQLite database onto every file in DATABASE_REPLICA_NAMES with the
+# online backup API, once or every --interval seconds (the interval then
+# plays the part of replication lag).
+
+
+class Command(BaseCommand):
+    help = 'Copy the primary SQLite database onto the configured replica files'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--interval', type=float, help='Keep copying every N seconds until interrupted')
+
+    def handle(self, *args, **options):
+        aliases = settings.DATABASE_REPLICAS
+        if not aliases:
+            raise CommandError('No replicas configured; set DATABASE_REPLICA_NAMES.')
+        if any(connections[alias].vendor != 'sqlite' for alias in ['default', *aliases]):
+            raise CommandError('sync_replicas only copies SQLite databases; use your database replication otherwise.')
+        while True:
+            started = time.perf_counter()
+            with sqlite3.connect(connections['default'].settings_dict['NAME']) as source:
+                for alias in aliases:
+                    with sqlite3.connect(connections[alias].settings_dict['NAME']) as target:
+                        source.backup(target)
+                    target.close()
+            source.close()
+            self.stdout.write(f'Copied the primary to {len(aliases)} replica(s) in {time.perf_counter() - started:.2f}s')
+            if not options['interval']:
+                return
+            time.sleep(options['interval'])
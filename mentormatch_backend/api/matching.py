@@ -0,0 +1,431 @@
+import heapq
+import logging
+import threading
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import connections, transaction
+from django.db.models import Exists, F, OuterRef, Q, Window
+from django.db.models.functions import RowNumber
+from django.utils import timezone
+
+from .models import User, Swipe, Match, MatchScore, MatchScoreOverflow, MatchScoreRefresh
+
+logger = logging.getLogger(__name__)
+
+# Scoring for potential matches. Skills are compared case-insensitively, so
+# every lower-cased skill name gets one bit and a user's skills become a
+# single integer. Candidates' skills are loaded with one query per relation
+# and each score is then a handful of bitwise operations.
+#
+# Scores between users of the same country are also persisted in MatchScore,
+# at most MATCH_SCORE_TOP_N rows per user, so the default (local) deck is an
+# indexed read. A user's rows are always the head of their ranking: when a
+# list is cut short (MatchScoreOverflow), the deck continues past the stored
+# rows with live scoring. When skills, verification or country change, the
+# user is queued (request_score_refresh) and refresh_match_scores() runs
+# after the request, in a background thread or from the refresh_match_scores
+# command.
+
+OPPOSITE_ROLE = {'student': 'professional', 'professional': 'student'}
+
+
+class SkillBits:
+    """Assigns a bit to each lower-cased skill name seen so far."""
+
+    def __init__(self):
+        self._bits = {}
+
+    def bit(self, name):
+        key = name.lower()
+        bit = self._bits.get(key)
+        if bit is None:
+            bit = 1 << len(self._bits)
+            self._bits[key] = bit
+        return bit
+
+
+def load_skill_masks(users, relation, bits):
+    """Return {user_id: mask} for the `skills_offered`/`skills_needed` relation of `users`.
+
+    `users` may be a queryset (used as a subquery) or an iterable of ids.
+    Users without skills are absent from the result.
+    """
+    through = getattr(User, relation).through
+    rows = through.objects.filter(user_id__in=_ids_or_subquery(users)).values_list('user_id', 'skill__name')
+    masks = {}
+    for user_id, name in rows.iterator(chunk_size=2000):
+        masks[user_id] = masks.get(user_id, 0) | bits.bit(name)
+    return masks
+
+
+def _ids_or_subquery(users):
+    if hasattr(users, 'values'):
+        return users.values('id')
+    return list(users)
+
+
+def candidate_queryset(user, local=True, offered=None, needed=None):
+    """Users `user` may be shown in the swipe deck.
+
+    `local` restricts to the user's country (and state, if set); `offered`
+    and `needed` keep candidates offering/needing that skill.
+    """
+    candidates = User.objects.filter(role=OPPOSITE_ROLE[user.role]).exclude(id=user.id)
+    if user.role == 'student':
+        candidates = candidates.filter(is_verified=True)
+    # Skip anyone already swiped on or matched with (NOT EXISTS anti-joins)
+    candidates = candidates.exclude(
+        Exists(Swipe.objects.filter(from_user=user, to_user=OuterRef('pk')))
+    ).exclude(
+        Exists(Match.objects.filter(Q(user1=user, user2=OuterRef('pk')) | Q(user2=user, user1=OuterRef('pk'))))
+    )
+    if local:
+        candidates = candidates.filter(country=user.country)
+        if user.state:
+            candidates = candidates.filter(state=user.state)
+    if offered:
+        candidates = candidates.filter(skills_offered__name__iexact=offered)
+    if needed:
+        candidates = candidates.filter(skills_needed__name__iexact=needed)
+    return candidates
+
+
+def score_pair(user_offered, user_needed, cand_offered, cand_needed, verified_bonus=False):
+    """Compatibility score (0-100) of a candidate from the user's point of view."""
+    cross_teach_overlap = (user_needed & cand_offered).bit_count() + (user_offered & cand_needed).bit_count()
+    offered_synergy = (user_offered & cand_offered).bit_count()
+    needed_synergy = (user_needed & cand_needed).bit_count()
+
+    teach_union = (user_needed | cand_offered).bit_count() or 1
+    learn_union = (user_offered | cand_needed).bit_count() or 1
+    teach_jaccard = cross_teach_overlap / teach_union
+    learn_jaccard = cross_teach_overlap / learn_union
+    synergy_score = (offered_synergy + needed_synergy) / ((user_offered.bit_count() + user_needed.bit_count()) or 1)
+    score = teach_jaccard * 0.7 + learn_jaccard * 0.2 + synergy_score * 0.1
+    if verified_bonus:
+        score += 0.1
+    return min(100, round(score * 100))
+
+
+def score_candidates(user, candidates):
+    """Score every candidate in `candidates` for `user`.
+
+    Returns a list of (candidate, score) pairs in queryset order.
+    """
+    bits = SkillBits()
+    user_offered = load_skill_masks([user.id], 'skills_offered', bits).get(user.id, 0)
+    user_needed = load_skill_masks([user.id], 'skills_needed', bits).get(user.id, 0)
+    offered = load_skill_masks(candidates, 'skills_offered', bits)
+    needed = load_skill_masks(candidates, 'skills_needed', bits)
+    student = user.role == 'student'
+    return [
+        (c, score_pair(user_offered, user_needed, offered.get(c.id, 0), needed.get(c.id, 0), student and c.is_verified))
+        for c in candidates
+    ]
+
+
+def base_score(user):
+    """Score of any candidate sharing no skill with `user`.
+
+    Students only see verified professionals, so they always get the bonus.
+    """
+    return score_pair(0, 0, 0, 0, user.role == 'student')
+
+
+def score_inputs(user):
+    """Everything a stored score of `user` depends on, for change detection."""
+    return (
+        user.role,
+        user.country,
+        user.is_verified,
+        frozenset(n.lower() for n in user.skills_offered.values_list('name', flat=True)),
+        frozenset(n.lower() for n in user.skills_needed.values_list('name', flat=True)),
+    )
+
+
+def stored_matches(user, candidates, after=None, limit=None):
+    """Return [(candidate, score)] for `candidates` from MatchScore, best first.
+
+    Every candidate without a stored row ranks below the stored ones. If the
+    user's list was cut short they are scored live (top_candidates);
+    otherwise they share no skill with the user, score the base score and
+    follow in id order. `after` is a (score, id) cursor; only candidates
+    ranked below it are returned. Only valid for candidates in the user's
+    country.
+    """
+    stored = MatchScore.objects.filter(user=user, candidate__in=candidates.values('id'))
+    if after is not None:
+        score, cid = after
+        stored = stored.filter(Q(score__lt=score) | Q(score=score, candidate_id__gt=cid))
+    stored = stored.select_related('candidate').order_by('-score', 'candidate_id')
+    if limit is not None:
+        stored = stored[:limit]
+    ranked = [(row.candidate, row.score) for row in stored]
+    if limit is not None and len(ranked) >= limit:
+        return ranked
+    more = None if limit is None else limit - len(ranked)
+    rest = candidates.exclude(id__in=MatchScore.objects.filter(user=user).values('candidate_id'))
+    if MatchScoreOverflow.objects.filter(user=user).exists():
+        return ranked + top_candidates(user, rest, after, more)
+    base = base_score(user)
+    if after is not None:
+        score, cid = after
+        if score < base:
+            return ranked
+        if score == base:
+            rest = rest.filter(id__gt=cid)
+    rest = rest.order_by('id')
+    ranked.extend((c, base) for c in (rest if more is None else rest[:more]))
+    return ranked
+
+
+def top_candidates(user, candidates, after=None, limit=None):
+    """Score `candidates` live and return the best `limit` after the cursor."""
+    scored = score_candidates(user, candidates)
+    key = lambda cs: (-cs[1], cs[0].id)
+    if after is not None:
+        cursor = (-after[0], after[1])
+        scored = [cs for cs in scored if key(cs) > cursor]
+    if limit is None:
+        return sorted(scored, key=key)
+    return heapq.nsmallest(limit, scored, key=key)
+
+
+def top_n():
+    return getattr(settings, 'MATCH_SCORE_TOP_N', 100)
+
+
+def request_score_refresh(user_ids):
+    """Queue `user_ids` for refresh_match_scores(), run once the transaction commits."""
+    now = timezone.now()
+    MatchScoreRefresh.objects.bulk_create(
+        [MatchScoreRefresh(user_id=uid, requested_at=now) for uid in set(user_ids)],
+        update_conflicts=True, unique_fields=['user'], update_fields=['requested_at'],
+    )
+    transaction.on_commit(lambda: _get_executor().submit(_run_refreshes))
+
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def _get_executor():
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                # One worker: refreshes of the same lists must not interleave
+                _executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='match-scores')
+    return _executor
+
+
+def wait_for_score_refreshes():
+    """Block until the refreshes already scheduled in this process have run."""
+    _get_executor().submit(lambda: None).result()
+
+
+def _run_refreshes():
+    try:
+        process_score_refreshes()
+    except Exception:
+        logger.exception('Refreshing match scores failed; run manage.py refresh_match_scores')
+    finally:
+        connections.close_all()
+
+
+def process_score_refreshes(batch_size=500):
+    """Refresh the queued users, oldest request first; returns how many were done."""
+    done = 0
+    while True:
+        pending = list(MatchScoreRefresh.objects.order_by('requested_at', 'user_id').values_list('user_id', 'requested_at')[:batch_size])
+        if not pending:
+            return done
+        user_ids = [uid for uid, _ in pending]
+        refresh_match_scores(user_ids)
+        # A user queued again meanwhile has a newer requested_at and stays queued
+        MatchScoreRefresh.objects.filter(user_id__in=user_ids, requested_at__lte=max(at for _, at in pending)).delete()
+        done += len(pending)
+
+
+def refresh_match_scores(user_ids):
+    """Bring the stored scores of `user_ids` up to date in both directions.
+
+    Each user's own list is recomputed. As a candidate, their new score is
+    merged into the lists of the opposite role in their country, which are
+    trimmed back to the top N; nobody else's list is rescored here. The cost
+    is the size of the country group per changed user, not its square. A
+    cut-short list that loses a row it cannot replace stays a correct, if
+    shorter, head of the ranking and is queued to be refilled.
+    """
+    user_ids = set(user_ids)
+    limit = top_n()
+    groups = defaultdict(list)
+    for u in User.objects.filter(id__in=user_ids).exclude(country='').only('id', 'role', 'country', 'is_verified'):
+        groups[(u.country, u.role)].append(u)
+    refill = set()
+    # Users without a country (or gone) keep no scores
+    unplaced = user_ids - {u.id for group in groups.values() for u in group}
+    if unplaced:
+        with transaction.atomic():
+            # Write first: on SQLite a transaction that reads before its
+            # first write fails with "database is locked" instead of waiting
+            # when another connection is writing.
+            MatchScoreOverflow.objects.filter(user_id__in=unplaced).delete()
+            viewers = set(MatchScore.objects.filter(candidate_id__in=unplaced).values_list('user_id', flat=True))
+            refill |= _overflowed(viewers - user_ids)
+            MatchScore.objects.filter(Q(user_id__in=unplaced) | Q(candidate_id__in=unplaced)).delete()
+    for (country, role), group in groups.items():
+        others = User.objects.filter(country=country, role=OPPOSITE_ROLE[role]).only('id', 'role', 'is_verified')
+        bits = SkillBits()
+        group_ids = [u.id for u in group]
+        offered = load_skill_masks(group_ids, 'skills_offered', bits)
+        needed = load_skill_masks(group_ids, 'skills_needed', bits)
+        offered.update(load_skill_masks(others, 'skills_offered', bits))
+        needed.update(load_skill_masks(others, 'skills_needed', bits))
+        others = list(others)
+        own, as_candidate = {}, {}
+        cut = _score_into(own, group, others, offered, needed, limit)
+        # Changed users' own lists are rebuilt whole by their own group
+        _score_into(as_candidate, [o for o in others if o.id not in user_ids], group, offered, needed)
+        with transaction.atomic():
+            # Write first (see above); the reads below concern other users
+            MatchScore.objects.filter(user_id__in=group_ids).delete()
+            as_candidate_of = MatchScore.objects.filter(candidate_id__in=group_ids).exclude(user_id__in=user_ids)
+            held = set(as_candidate_of.values_list('user_id', 'candidate_id'))
+            viewers = {v for v, _ in as_candidate} | {v for v, _ in held}
+            overflowed = _overflowed(viewers)
+            last = _last_keys(overflowed)
+            # A cut-short list only takes candidates ranked above its last
+            # row (the unstored ones all rank below it); a list that holds
+            # every candidate above the base score takes them all.
+            merged = {
+                (v, c): score for (v, c), score in as_candidate.items()
+                if v not in overflowed or (v in last and (-score, c) <= last[v])
+            }
+            refill |= {v for v, c in held if (v, c) not in merged and v in overflowed}
+            as_candidate_of.delete()
+            MatchScore.objects.bulk_create(
+                [MatchScore(user_id=v, candidate_id=c, score=s) for (v, c), s in {**own, **merged}.items()],
+                batch_size=1000,
+            )
+            trimmed = _trim({v for v, _ in merged}, limit)
+            MatchScoreOverflow.objects.filter(user_id__in=group_ids).delete()
+            MatchScoreOverflow.objects.bulk_create(
+                [MatchScoreOverflow(user_id=uid) for uid in cut | trimmed], ignore_conflicts=True, batch_size=1000,
+            )
+    if refill:
+        request_score_refresh(refill - user_ids)
+
+
+def _overflowed(user_ids):
+    """The users among `user_ids` whose stored list is cut short."""
+    found = set()
+    for chunk in _chunks(list(user_ids)):
+        found.update(MatchScoreOverflow.objects.filter(user_id__in=chunk).values_list('user_id', flat=True))
+    return found
+
+
+def _last_keys(user_ids):
+    """{user_id: (-score, candidate_id)} of the last stored row of each of `user_ids`."""
+    last = {}
+    for chunk in _chunks(list(user_ids)):
+        ranked = MatchScore.objects.filter(user_id__in=chunk).annotate(rank=Window(
+            RowNumber(), partition_by=[F('user_id')], order_by=[F('score').asc(), F('candidate_id').desc()],
+        ))
+        for uid, score, cid in ranked.filter(rank=1).values_list('user_id', 'score', 'candidate_id'):
+            last[uid] = (-score, cid)
+    return last
+
+
+def _trim(user_ids, limit):
+    """Drop the stored rows of `user_ids` ranked below the top `limit`.
+
+    Returns the users who lost rows.
+    """
+    trimmed = set()
+    for chunk in _chunks(list(user_ids)):
+        ranked = MatchScore.objects.filter(user_id__in=chunk).annotate(rank=Window(
+            RowNumber(), partition_by=[F('user_id')], order_by=[F('score').desc(), F('candidate_id').asc()],
+        ))
+        extra = list(ranked.filter(rank__gt=limit).values_list('id', 'user_id'))
+        if extra:
+            MatchScore.objects.filter(id__in=[row_id for row_id, _ in extra]).delete()
+            trimmed.update(uid for _, uid in extra)
+    return trimmed
+
+
+def _chunks(items, size=2000):
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+
+def rebuild_match_scores(countries=None, stdout=None):
+    """Recompute MatchScore from scratch, one country at a time."""
+    users = User.objects.exclude(country='')
+    if countries:
+        users = users.filter(country__in=countries)
+    for country in users.order_by().values_list('country', flat=True).distinct():
+        students = User.objects.filter(country=country, role='student').only('id', 'role', 'is_verified')
+        professionals = User.objects.filter(country=country, role='professional').only('id', 'role', 'is_verified')
+        bits = SkillBits()
+        offered = load_skill_masks(User.objects.filter(country=country), 'skills_offered', bits)
+        needed = load_skill_masks(User.objects.filter(country=country), 'skills_needed', bits)
+        students, professionals = list(students), list(professionals)
+        rows = {}
+        cut = _score_into(rows, students, professionals, offered, needed, top_n())
+        cut |= _score_into(rows, professionals, students, offered, needed, top_n())
+        with transaction.atomic():
+            MatchScore.objects.filter(user__country=country).delete()
+            MatchScore.objects.bulk_create(
+                [MatchScore(user_id=v, candidate_id=c, score=s) for (v, c), s in rows.items()],
+                batch_size=1000,
+            )
+            MatchScoreOverflow.objects.filter(user__country=country).delete()
+            MatchScoreOverflow.objects.bulk_create([MatchScoreOverflow(user_id=uid) for uid in cut], batch_size=1000)
+        if stdout:
+            stdout.write(f'{country}: {len(rows)} scores')
+    if not countries:
+        # Leftovers from users who moved without a refresh (e.g. admin edits).
+        MatchScore.objects.exclude(user__country=F('candidate__country')).delete()
+        MatchScoreOverflow.objects.filter(user__country='').delete()
+
+
+def _score_into(rows, viewers, candidates, offered, needed, limit=None):
+    """Add the non-base scores of viewer/candidate pairs sharing a skill to `rows`.
+
+    With `limit`, only each viewer's best `limit` candidates are added.
+    Returns the ids of the viewers who had more.
+    """
+    cut = set()
+    postings = defaultdict(list)
+    for c in candidates:
+        mask = offered.get(c.id, 0) | needed.get(c.id, 0)
+        while mask:
+            low = mask & -mask
+            postings[low].append(c)
+            mask ^= low
+    for v in viewers:
+        v_offered, v_needed = offered.get(v.id, 0), needed.get(v.id, 0)
+        student = v.role == 'student'
+        base = base_score(v)
+        mask = v_offered | v_needed
+        seen = set()
+        scored = []
+        while mask:
+            low = mask & -mask
+            mask ^= low
+            for c in postings.get(low, ()):
+                if c.id in seen or (student and not c.is_verified):
+                    continue
+                seen.add(c.id)
+                score = score_pair(v_offered, v_needed, offered.get(c.id, 0), needed.get(c.id, 0), student)
+                if score != base:
+                    scored.append((-score, c.id))
+        if limit is not None and len(scored) > limit:
+            scored = heapq.nsmallest(limit, scored)
+            cut.add(v.id)
+        for negative, cid in scored:
+            rows[(v.id, cid)] = -negative
+    return cut
@@ -0,0 +1,199 @@
+import hashlib
+import io
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlencode
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.signing import Signer
+from django.db import connections, transaction
+from django.db.models import Q
+from django.urls import reverse
+from django.utils.crypto import constant_time_compare
+
+from .models import Match, Media
+
+logger = logging.getLogger(__name__)
+
+# Uploads are stored once per distinct content: the file name is derived
+# from the SHA-256 of the bytes, so identical uploads (from any user) share a
+# single stored file. Resized variants are generated after the request has
+# committed, in a small thread pool, and are also keyed by content hash.
+#
+# Django's upload handlers already spool large uploads to a temporary file in
+# chunks; store_upload() hashes that file chunk by chunk and moves it into
+# place, so the upload is never held in memory as a whole.
+
+UPLOAD_DIR = 'user_media'
+VARIANT_DIR = 'user_media/variants'
+
+# name -> longest side in pixels
+VARIANTS = {
+    'thumb': 256,
+    'preview': 1024,
+}
+
+
+def store_upload(upload):
+    """Save `upload` under its content hash and return (name, sha256 hex)."""
+    content_hash = file_hash(upload)
+    ext = os.path.splitext(upload.name)[1].lower()[:10]
+    name = f'{UPLOAD_DIR}/{content_hash[:2]}/{content_hash}{ext}'
+    if not default_storage.exists(name):
+        upload.seek(0)
+        name = default_storage.save(name, upload)
+    return name, content_hash
+
+
+def file_hash(f):
+    """SHA-256 hex digest of a Django File, read in chunks."""
+    digest = hashlib.sha256()
+    for chunk in f.chunks():
+        digest.update(chunk)
+    return digest.hexdigest()
+
+
+def variant_name(content_hash, variant):
+    return f'{VARIANT_DIR}/{content_hash[:2]}/{content_hash}_{variant}.jpg'
+
+
+def variant_names(media):
+    """{variant: stored name} for a processed image, empty until processing is done."""
+    if media.processing_status != 'ready':
+        return {}
+    return {variant: variant_name(media.content_hash, variant) for variant in VARIANTS}
+
+
+def generate_variants(media_id):
+    """Create the resized variants of one Media row and record the outcome."""
+    media = Media.objects.filter(id=media_id).first()
+    if media is None or media.processing_status != 'pending':
+        return
+    if media.media_type != 'image':
+        status = 'skipped'
+    else:
+        try:
+            _render_variants(media)
+            status = 'ready'
+        except Exception:
+            logger.exception('Could not generate variants for media %s', media_id)
+            status = 'failed'
+    Media.objects.filter(id=media_id).update(processing_status=status)
+
+
+def _render_variants(media):
+    from PIL import Image, ImageOps
+
+    missing = {v: size for v, size in VARIANTS.items()
+               if not default_storage.exists(variant_name(media.content_hash, v))}
+    if not missing:
+        return  # Same content uploaded before
+    with media.file.open('rb') as f, Image.open(f) as original:
+        image = ImageOps.exif_transpose(original).convert('RGB')
+    # Largest first, so each smaller variant is resampled from fewer pixels
+    for variant, size in sorted(missing.items(), key=lambda item: -item[1]):
+        image.thumbnail((size, size))
+        out = io.BytesIO()
+        image.save(out, 'JPEG', quality=85, optimize=True, progressive=True)
+        default_storage.save(variant_name(media.content_hash, variant), ContentFile(out.getvalue()))
+
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def _get_executor():
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(
+                    max_workers=getattr(settings, 'MEDIA_WORKERS', 2),
+                    thread_name_prefix='media',
+                )
+    return _executor
+
+
+def _run(media_id):
+    try:
+        generate_variants(media_id)
+    finally:
+        # Connections are per thread; close this worker's so none are leaked
+        connections.close_all()
+
+
+def schedule_variants(media):
+    """Generate the variants of `media` in the worker pool once the transaction commits."""
+    transaction.on_commit(lambda: _get_executor().submit(_run, media.id))
+
+
+def release_file(name, content_hash):
+    """Delete a stored upload (and its variants) unless another Media row still uses it."""
+    if not name or Media.objects.filter(file=name).exists():
+        return
+    default_storage.delete(name)
+    if content_hash and not Media.objects.filter(content_hash=content_hash).exists():
+        for variant in VARIANTS:
+            default_storage.delete(variant_name(content_hash, variant))
+
+
+# Access control. Media is visible to its owner and to the users they are
+# matched with; the answer is cached per pair and dropped by the Match
+# signal handlers (see api/signals.py).
+
+def access_key(viewer_id, owner_id):
+    return f'media-access:{viewer_id}:{owner_id}'
+
+
+def can_view_media(viewer_id, owner_id):
+    if viewer_id == owner_id:
+        return True
+    key = access_key(viewer_id, owner_id)
+    allowed = cache.get(key)
+    if allowed is None:
+        allowed = Match.objects.filter(
+            Q(user1_id=viewer_id, user2_id=owner_id) | Q(user1_id=owner_id, user2_id=viewer_id)
+        ).exists()
+        cache.set(key, allowed, getattr(settings, 'MEDIA_ACCESS_CACHE_TIMEOUT', 300))
+    return allowed
+
+
+def forget_media_access(user1_id, user2_id):
+    cache.delete_many([access_key(user1_id, user2_id), access_key(user2_id, user1_id)])
+
+
+# Signed file URLs, so <img>/<video> tags (which cannot send a bearer token)
+# can load media through the authorized endpoint. The expiry is rounded to
+# the hour, so a URL stays the same between listings and browsers can cache.
+
+_signer = Signer(salt='api.media')
+
+
+def _signature(media_id, viewer_id, expires):
+    return _signer.signature(f'{media_id}:{viewer_id}:{expires}')
+
+
+def signed_file_url(media_id, viewer_id, variant=None):
+    max_age = getattr(settings, 'MEDIA_URL_MAX_AGE', 3600)
+    expires = (int(time.time()) // 3600) * 3600 + 3600 + max_age
+    params = {'u': viewer_id, 'e': expires, 's': _signature(media_id, viewer_id, expires)}
+    if variant:
+        params['variant'] = variant
+    return f"{reverse('media-file', args=[media_id])}?{urlencode(params)}"
+
+
+def signed_viewer(media_id, params):
+    """The viewer id a signed URL was issued to, or None if it is invalid or expired."""
+    try:
+        viewer_id, expires = int(params['u']), int(params['e'])
+    except (KeyError, ValueError):
+        return None
+    if expires < time.time() or not constant_time_compare(params.get('s', ''), _signature(media_id, viewer_id, expires)):
+        return None
+    return viewer_id
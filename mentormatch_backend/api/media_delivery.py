@@ -0,0 +1,138 @@
+import os
+import re
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.http import FileResponse, HttpResponse
+
+# Serving stored files once access has been checked. With MEDIA_SENDFILE set
+# the front server (Apache mod_xsendfile or nginx X-Accel-Redirect) sends the
+# bytes and handles Range itself; otherwise a FileResponse streams the file,
+# which WSGI servers with a file_wrapper (gunicorn, uWSGI) turn into
+# sendfile(). Either way responses carry a strong ETag and honour
+# If-None-Match, and Django handles single byte ranges for seeking in videos.
+#
+# The Content-Type never comes from the uploader: only the extensions below,
+# for the matching media_type, are served inline as what they claim to be.
+# Anything else (say an "image" named x.html) goes out as an octet-stream
+# attachment, and nosniff keeps browsers from guessing otherwise.
+
+RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+CACHE_CONTROL = 'private, max-age=86400'
+INLINE_TYPES = {
+    'image': {'.jpg': 'image/jpeg', '.jpeg': 'image/jpeg', '.png': 'image/png', '.gif': 'image/gif', '.webp': 'image/webp'},
+    'video': {'.mp4': 'video/mp4', '.m4v': 'video/mp4', '.mov': 'video/quicktime', '.webm': 'video/webm', '.ogv': 'video/ogg'},
+}
+
+
+def content_type_for(name, media_type):
+    """Content-Type to serve stored file `name` of a `media_type` upload with, or None."""
+    return INLINE_TYPES.get(media_type, {}).get(os.path.splitext(name)[1].lower())
+
+
+def serve_file(request, name, etag=None, media_type=None):
+    """Response for stored file `name`, honouring conditional and Range requests."""
+    if etag:
+        etag = f'"{etag}"'
+        if etag in _etags(request.headers.get('If-None-Match', '')):
+            return _with_headers(HttpResponse(status=304), etag)
+
+    content_type = content_type_for(name, media_type)
+    inline = content_type is not None
+    content_type = content_type or 'application/octet-stream'
+    mode = getattr(settings, 'MEDIA_SENDFILE', '')
+    if mode == 'x-sendfile':
+        response = HttpResponse(content_type=content_type)
+        response['X-Sendfile'] = default_storage.path(name)
+        return _with_headers(response, etag, inline)
+    if mode == 'x-accel-redirect':
+        response = HttpResponse(content_type=content_type)
+        response['X-Accel-Redirect'] = getattr(settings, 'MEDIA_ACCEL_PREFIX', '/protected-media/') + name
+        return _with_headers(response, etag, inline)
+
+    try:
+        f = default_storage.open(name, 'rb')
+    except FileNotFoundError:
+        return HttpResponse(status=404)
+    size = f.size
+    byte_range = _byte_range(request, etag, size)
+    if byte_range is None:
+        return _with_headers(FileResponse(f, content_type=content_type), etag, inline)
+    if byte_range is False:
+        f.close()
+        response = HttpResponse(status=416)
+        response['Content-Range'] = f'bytes */{size}'
+        return _with_headers(response, etag, inline)
+    start, end = byte_range
+    response = FileResponse(_FileRange(f, start, end - start + 1), content_type=content_type, status=206)
+    response['Content-Length'] = end - start + 1
+    response['Content-Range'] = f'bytes {start}-{end}/{size}'
+    return _with_headers(response, etag, inline)
+
+
+def _etags(header):
+    return {tag.strip() for tag in header.split(',')} if header else set()
+
+
+def _with_headers(response, etag, inline=True):
+    response['Accept-Ranges'] = 'bytes'
+    response['Cache-Control'] = CACHE_CONTROL
+    response['X-Content-Type-Options'] = 'nosniff'
+    if not inline:
+        response['Content-Disposition'] = 'attachment'
+    if etag:
+        response['ETag'] = etag
+    return response
+
+
+def _byte_range(request, etag, size):
+    """(start, end) of a satisfiable single Range, False if unsatisfiable, None to send everything."""
+    header = request.headers.get('Range')
+    if not header:
+        return None
+    if_range = request.headers.get('If-Range')
+    if if_range and if_range != etag:
+        return None  # The client's partial copy is stale
+    match = RANGE_RE.match(header.strip())
+    if not match:
+        return None  # Multiple or malformed ranges: a full response is allowed
+    first, last = match.groups()
+    if not first:
+        if not last:
+            return None
+        start, end = max(size - int(last), 0), size - 1  # Suffix: the last N bytes
+    else:
+        start = int(first)
+        end = min(int(last), size - 1) if last else size - 1
+    if start >= size or start > end:
+        return False
+    return start, end
+
+
+class _FileRange:
+    """Read-only view of `length` bytes of `f` starting at `start`.
+
+    It has no tell()/seek(), so FileResponse leaves Content-Length to the
+    caller, and it exposes fileno() with `f` positioned at `start`, so a WSGI
+    file_wrapper can still sendfile() the range.
+    """
+
+    def __init__(self, f, start, length):
+        f.seek(start)
+        self._f = f
+        self._remaining = length
+        self.name = getattr(f, 'name', '')
+
+    def read(self, size=-1):
+        if self._remaining <= 0:
+            return b''
+        size = self._remaining if size is None or size < 0 else min(size, self._remaining)
+        data = self._f.read(size)
+        self._remaining -= len(data)
+        return data
+
+    def fileno(self):
+        return self._f.fileno()
+
+    def close(self):
+        self._f.close()
@@ -0,0 +1,203 @@
+import hmac
+import threading
+import time
+from bisect import bisect_left
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.contrib.auth.models import AnonymousUser
+from rest_framework.authentication import BaseAuthentication
+from rest_framework.permissions import BasePermission
+
+from .querybudget import QueryCounter
+
+# In-process request metrics, exposed in the Prometheus text format by
+# views.MetricsView. Every process keeps its own numbers; with several
+# workers, scrape each one (or put them behind a multiprocess exporter).
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+
+# name: (help, buckets), all labelled by view and method
+HISTOGRAMS = {
+    'mentormatch_http_request_duration_seconds': ('Time spent handling the request', LATENCY_BUCKETS),
+    'mentormatch_db_queries_per_request': ('SQL queries run per request', QUERY_BUCKETS),
+    'mentormatch_db_query_duration_seconds': ('Time spent in SQL per request', LATENCY_BUCKETS),
+    'mentormatch_serializer_duration_seconds': ('Time spent in api serializers per request', LATENCY_BUCKETS),
+    'mentormatch_http_response_size_bytes': ('Response body size (streamed bodies only if their length is known)', SIZE_BUCKETS),
+}
+
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # The last slot is +Inf
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+
+
+class Registry:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._requests = {}  # (view, method, status) -> count
+        self._histograms = {}  # (name, view, method) -> Histogram
+
+    def record(self, view, method, status, observations):
+        with self._lock:
+            key = (view, method, str(status))
+            self._requests[key] = self._requests.get(key, 0) + 1
+            for name, value in observations.items():
+                histogram = self._histograms.get((name, view, method))
+                if histogram is None:
+                    histogram = self._histograms[(name, view, method)] = Histogram(HISTOGRAMS[name][1])
+                histogram.observe(value)
+
+    def render(self):
+        """The current values in the Prometheus text exposition format."""
+        with self._lock:
+            requests = sorted(self._requests.items())
+            histograms = sorted(
+                (key, list(h.counts), h.sum) for key, h in self._histograms.items()
+            )
+        lines = [
+            '# HELP mentormatch_http_requests_total Requests handled',
+            '# TYPE mentormatch_http_requests_total counter',
+        ]
+        for (view, method, status), count in requests:
+            lines.append(f'mentormatch_http_requests_total{_labels(view=view, method=method, status=status)} {count}')
+        for name, (help_text, buckets) in HISTOGRAMS.items():
+            lines.append(f'# HELP {name} {help_text}')
+            lines.append(f'# TYPE {name} histogram')
+            for (hist_name, view, method), counts, total in histograms:
+                if hist_name != name:
+                    continue
+                cumulative = 0
+                for bound, count in zip((*buckets, '+Inf'), counts):
+                    cumulative += count
+                    lines.append(f'{name}_bucket{_labels(view=view, method=method, le=bound)} {cumulative}')
+                lines.append(f'{name}_sum{_labels(view=view, method=method)} {total}')
+                lines.append(f'{name}_count{_labels(view=view, method=method)} {cumulative}')
+        return '\n'.join(lines) + '\n'
+
+    def reset(self):
+        with self._lock:
+            self._requests.clear()
+            self._histograms.clear()
+
+
+def _labels(**labels):
+    def escape(value):
+        return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+    return '{' + ','.join(f'{k}="{escape(v)}"' for k, v in labels.items()) + '}'
+
+
+registry = Registry()
+
+
+# Serializer time: the api serializers (api.serializers.ModelSerializer and
+# Serializer) add the time spent in to_representation to the current
+# request. Only the outermost call counts, so nested serializers are not
+# counted twice; a many=True list adds up its items.
+
+class _RequestTimings:
+    __slots__ = ('serializer_seconds', 'depth')
+
+    def __init__(self):
+        self.serializer_seconds = 0.0
+        self.depth = 0
+
+
+_current = ContextVar('api_metrics_request', default=None)
+
+
+class TimedSerializerMixin:
+    def to_representation(self, instance):
+        timings = _current.get()
+        if timings is None:
+            return super().to_representation(instance)
+        timings.depth += 1
+        start = time.perf_counter()
+        try:
+            return super().to_representation(instance)
+        finally:
+            timings.depth -= 1
+            if timings.depth == 0:
+                timings.serializer_seconds += time.perf_counter() - start
+
+
+SCRAPER = 'metrics-scraper'  # request.auth of a request made with METRICS_TOKEN
+
+
+class MetricsTokenAuthentication(BaseAuthentication):
+    """Lets a scraper in with the static METRICS_TOKEN ("Authorization: Bearer <token>")."""
+
+    def authenticate(self, request):
+        token = getattr(settings, 'METRICS_TOKEN', '')
+        header = request.headers.get('Authorization', '')
+        if not token or not header.startswith('Bearer '):
+            return None
+        if not hmac.compare_digest(header[len('Bearer '):].encode(), token.encode()):
+            return None  # Maybe a JWT; the next authentication class decides
+        return AnonymousUser(), SCRAPER
+
+
+class CanReadMetrics(BasePermission):
+    """The metrics scraper token, or a staff user."""
+
+    def has_permission(self, request, view):
+        return request.auth == SCRAPER or bool(request.user and request.user.is_staff)
+
+
+class MetricsMiddleware:
+    """Records latency, SQL work, serializer time and response size per view."""
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        timings = _RequestTimings()
+        token = _current.set(timings)
+        start = time.perf_counter()
+        try:
+            with QueryCounter() as counter:
+                response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        self._record(request, response, time.perf_counter() - start, counter, timings)
+        return response
+
+    async def __acall__(self, request):
+        timings = _RequestTimings()
+        token = _current.set(timings)
+        start = time.perf_counter()
+        try:
+            with QueryCounter() as counter:
+                response = await self.get_response(request)
+        finally:
+            _current.reset(token)
+        self._record(request, response, time.perf_counter() - start, counter, timings)
+        return response
+
+    def _record(self, request, response, elapsed, counter, timings):
+        match = request.resolver_match
+        view = match.view_name if match else 'unmatched'
+        size = int(response.get('Content-Length') or 0) if response.streaming else len(response.content)
+        registry.record(view, request.method, response.status_code, {
+            'mentormatch_http_request_duration_seconds': elapsed,
+            'mentormatch_db_queries_per_request': counter.count,
+            'mentormatch_db_query_duration_seconds': counter.seconds,
+            'mentormatch_serializer_duration_seconds': timings.serializer_seconds,
+            'mentormatch_http_response_size_bytes': size,
+        })
@@ -0,0 +1,17 @@
+# Generated by Django 5.2.18 on 2026-10-18 18:33
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0003_matchscore'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='message',
+            index=models.Index(fields=['match', 'timestamp', 'id'], name='api_message_history'),
+        ),
+    ]
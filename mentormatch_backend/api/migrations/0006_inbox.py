@@ -0,0 +1,58 @@
+# Generated by Django 5.2.18 on 2026-10-18 18:36
+
+import django.utils.timezone
+from django.db import migrations, models
+from django.db.models import F, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce, Substr
+
+
+def backfill_inbox(apps, schema_editor):
+    # Existing conversations start out fully read. One UPDATE with correlated
+    # subqueries, however many matches there are.
+    Match = apps.get_model('api', 'Match')
+    Message = apps.get_model('api', 'Message')
+    last = Message.objects.filter(match=OuterRef('pk')).order_by('-timestamp', '-id')
+    last_id = Coalesce(Subquery(last.values('id')[:1]), Value(0))
+    Match.objects.update(
+        last_activity_at=Coalesce(Subquery(last.values('timestamp')[:1]), F('timestamp')),
+        last_message_at=Subquery(last.values('timestamp')[:1]),
+        last_message_preview=Coalesce(Substr(Subquery(last.values('content')[:1]), 1, 120), Value('')),
+        user1_read_id=last_id,
+        user2_read_id=last_id,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0005_hot_path_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='match',
+            name='last_activity_at',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+        migrations.AddField(
+            model_name='match',
+            name='last_message_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='match',
+            name='last_message_preview',
+            field=models.CharField(blank=True, max_length=120),
+        ),
+        migrations.AddField(
+            model_name='match',
+            name='user1_read_id',
+            field=models.BigIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='match',
+            name='user2_read_id',
+            field=models.BigIntegerField(default=0),
+        ),
+        migrations.RunPython(backfill_inbox, migrations.RunPython.noop),
+    ]
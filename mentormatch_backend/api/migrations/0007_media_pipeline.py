@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-18 18:38
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0006_inbox'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='media',
+            name='content_hash',
+            field=models.CharField(blank=True, db_index=True, max_length=64),
+        ),
+        migrations.AddField(
+            model_name='media',
+            name='processing_status',
+            field=models.CharField(choices=[('pending', 'Pending'), ('ready', 'Ready'), ('skipped', 'Skipped'), ('failed', 'Failed')], default='pending', max_length=10),
+        ),
+    ]
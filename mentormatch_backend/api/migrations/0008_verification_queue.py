@@ -0,0 +1,17 @@
+# Generated by Django 5.2.18 on 2026-10-18 19:26
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0007_media_pipeline'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='verificationrequest',
+            index=models.Index(fields=['status', '-submitted_at', '-id'], name='api_verification_queue'),
+        ),
+    ]
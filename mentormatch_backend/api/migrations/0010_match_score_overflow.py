@@ -0,0 +1,31 @@
+# Generated by Django 5.2.18 on 2026-10-18 20:22
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+def mark_stored_lists(apps, schema_editor):
+    # Lists stored so far may have been cut or have lost rows; treat them all
+    # as cut short until rebuild_match_scores recomputes them.
+    MatchScore = apps.get_model('api', 'MatchScore')
+    MatchScoreOverflow = apps.get_model('api', 'MatchScoreOverflow')
+    user_ids = MatchScore.objects.order_by().values_list('user_id', flat=True).distinct()
+    MatchScoreOverflow.objects.bulk_create([MatchScoreOverflow(user_id=uid) for uid in user_ids.iterator()], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0009_match_score_refresh'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MatchScoreOverflow',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='+', serialize=False, to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.RunPython(mark_stored_lists, migrations.RunPython.noop),
+    ]
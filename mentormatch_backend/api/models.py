@@ -1,4 +1,4 @@
-from django.db import models
+from django.db import models, transaction
 from django.contrib.auth.models import AbstractUser
 from django.utils import timezone
 
@@ -53,6 +53,12 @@ class User(AbstractUser):
 
     deletion_scheduled_at = models.DateTimeField(blank=True, null=True)
 
+    class Meta(AbstractUser.Meta):
+        indexes = [
+            # Candidate decks in PotentialMatchesView and score refreshes
+            models.Index(fields=['role', 'country', 'state'], name='api_user_role_location'),
+        ]
+
     def __str__(self):
         return self.username
 
@@ -71,6 +77,14 @@ class Match(models.Model):
     user2 = models.ForeignKey(User, related_name='matches2', on_delete=models.CASCADE)
     timestamp = models.DateTimeField(auto_now_add=True)
 
+    # Denormalized for the inbox; kept up to date when a message is posted
+    last_activity_at = models.DateTimeField(default=timezone.now)
+    last_message_at = models.DateTimeField(blank=True, null=True)
+    last_message_preview = models.CharField(max_length=120, blank=True)
+    # Id of the last message each participant has read
+    user1_read_id = models.BigIntegerField(default=0)
+    user2_read_id = models.BigIntegerField(default=0)
+
     class Meta:
         unique_together = ('user1', 'user2')
 
@@ -80,10 +94,23 @@ class Message(models.Model):
     content = models.TextField()
     timestamp = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [
+            # Conversation history, paged by (timestamp, id)
+            models.Index(fields=['match', 'timestamp', 'id'], name='api_message_history'),
+        ]
+
     def __str__(self):
         return f'{self.sender}: {self.content[:30]}'
 
 
+MEDIA_PROCESSING_STATUS = (
+    ('pending', 'Pending'),
+    ('ready', 'Ready'),
+    ('skipped', 'Skipped'),
+    ('failed', 'Failed'),
+)
+
 class Media(models.Model):
     """User-uploaded media (images/videos/files). Only owner + matches can view."""
     MEDIA_TYPES = (
@@ -96,6 +123,9 @@ class Media(models.Model):
     media_type = models.CharField(max_length=10, choices=MEDIA_TYPES, default='image')
     uploaded_at = models.DateTimeField(auto_now_add=True)
     caption = models.CharField(max_length=255, blank=True)
+    # SHA-256 of the file; identical uploads share one stored file (see api/media.py)
+    content_hash = models.CharField(max_length=64, blank=True, db_index=True)
+    processing_status = models.CharField(max_length=10, choices=MEDIA_PROCESSING_STATUS, default='pending')
 
 VERIFICATION_STATUS = (
     ('pending', 'Pending'),
@@ -103,6 +133,34 @@ VERIFICATION_STATUS = (
     ('rejected', 'Rejected'),
 )
 
+class VerificationRequestQuerySet(models.QuerySet):
+    """Bulk counterparts of VerificationRequest.approve/reject.
+
+    Each runs a couple of set-based UPDATEs in one transaction instead of
+    saving every request and user. update() sends no signals, so cached
+    profiles of newly verified users are dropped here and their match
+    scores queued for one batched background refresh.
+    """
+
+    def approve(self, reviewer=None):
+        from .matching import request_score_refresh
+        from .profile_cache import invalidate_profiles
+        with transaction.atomic():
+            newly_verified = list(
+                User.objects.filter(id__in=self.values('user_id'), is_verified=False).values_list('id', flat=True)
+            )
+            User.objects.filter(id__in=newly_verified).update(is_verified=True)
+            count = self.update(status='approved', reviewed_at=timezone.now(), reviewer=reviewer)
+            if newly_verified:
+                request_score_refresh(newly_verified)
+        if newly_verified:
+            invalidate_profiles(newly_verified)
+        return count
+
+    def reject(self, reviewer=None):
+        return self.update(status='rejected', reviewed_at=timezone.now(), reviewer=reviewer)
+
+
 class VerificationRequest(models.Model):
     user = models.ForeignKey(User, related_name='verification_requests', on_delete=models.CASCADE)
     document = models.FileField(upload_to='verifications/')
@@ -111,6 +169,14 @@ class VerificationRequest(models.Model):
     reviewed_at = models.DateTimeField(null=True, blank=True)
     reviewer = models.ForeignKey(User, null=True, blank=True, related_name='verified_requests', on_delete=models.SET_NULL)
 
+    objects = VerificationRequestQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            # The review queue: one status, newest first (see VerificationRequestListView)
+            models.Index(fields=['status', '-submitted_at', '-id'], name='api_verification_queue'),
+        ]
+
     def approve(self, reviewer=None):
         self.status = 'approved'
         self.reviewed_at = timezone.now()
@@ -118,9 +184,41 @@ class VerificationRequest(models.Model):
         self.save()
         self.user.is_verified = True
         self.user.save()
+        from .matching import request_score_refresh
+        request_score_refresh([self.user_id])
 
     def reject(self, reviewer=None):
         self.status = 'rejected'
         self.reviewed_at = timezone.now()
         self.reviewer = reviewer
         self.save()
+
+
+class MatchScore(models.Model):
+    """Precomputed score of `candidate` as seen by `user` (same country only).
+
+    A user's rows are always their best candidates, in (-score, candidate)
+    order: at most MATCH_SCORE_TOP_N of those scoring above the base score
+    (see api.matching.base_score). MatchScoreOverflow marks users whose
+    list is cut short; everyone else's unstored candidates score the base.
+    """
+    user = models.ForeignKey(User, related_name='match_scores', on_delete=models.CASCADE)
+    candidate = models.ForeignKey(User, related_name='+', on_delete=models.CASCADE)
+    score = models.PositiveSmallIntegerField()
+
+    class Meta:
+        unique_together = ('user', 'candidate')
+        indexes = [
+            models.Index(fields=['user', '-score', 'candidate'], name='api_matchscore_rank'),
+        ]
+
+
+class MatchScoreRefresh(models.Model):
+    """A user whose stored match scores are out of date (see api.matching)."""
+    user = models.OneToOneField(User, primary_key=True, related_name='+', on_delete=models.CASCADE)
+    requested_at = models.DateTimeField(default=timezone.now, db_index=True)
+
+
+class MatchScoreOverflow(models.Model):
+    """A user with more candidates above the base score than MatchScore holds."""
+    user = models.OneToOneField(User, primary_key=True, related_name='+', on_delete=models.CASCADE)
@@ -0,0 +1,37 @@
+from django.conf import settings
+from django.core.cache import cache
+
+from .replicas import reads_from
+from .serializers import UserSerializer
+
+# Serialized profiles are cached per user and per visibility class: the
+# owner sees everything, everyone else gets the privacy-filtered version
+# (see UserSerializer.to_representation). Entries are dropped by the signal
+# handlers in api/signals.py whenever the user or their skills/hobbies change.
+
+VISIBILITY_CLASSES = ('self', 'other')
+
+
+def profile_key(user_id, visibility):
+    return f'profile:{user_id}:{visibility}'
+
+
+def get_profile(user_id, request, load):
+    """Return the serialized profile of `user_id` as seen by `request.user`.
+
+    `load` is called to fetch the User on a cache miss and may raise
+    (e.g. Http404).
+    """
+    is_self = request.user.is_authenticated and request.user.id == user_id
+    key = profile_key(user_id, 'self' if is_self else 'other')
+    data = cache.get(key)
+    if data is None:
+        # Cached for minutes, so never filled from a lagging replica
+        with reads_from(None):
+            data = dict(UserSerializer(load(), context={'request': request}).data)
+        cache.set(key, data, getattr(settings, 'PROFILE_CACHE_TIMEOUT', 300))
+    return data
+
+
+def invalidate_profiles(user_ids):
+    cache.delete_many([profile_key(uid, v) for uid in user_ids for v in VISIBILITY_CLASSES])
@@ -0,0 +1,219 @@
+import cProfile
+import io
+import json
+import logging
+import os
+import pstats
+import random
+import re
+import secrets
+import threading
+import time
+from contextlib import ExitStack, contextmanager
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.db import connections
+from django.utils import timezone
+from rest_framework.exceptions import APIException
+from rest_framework_simplejwt.authentication import JWTAuthentication
+
+# Opt-in request profiling. A staff user adds ?profile=1 (or the header
+# "X-Profile: 1") to any request; additionally PROFILING_SAMPLE_RATE
+# profiles that fraction of all requests, so slowness that only some users
+# hit is caught with their real data. The request then runs under cProfile
+# with every SQL statement timed, and the report is written to
+# PROFILING_DIR. Its id comes back in the X-Profile-Id header; staff fetch
+# it from /api/profiling/<id>/ (and the raw pstats dump from .../pstats/).
+#
+# Only one request is profiled at a time per process (cProfile allows a
+# single active profiler from Python 3.12); requests arriving meanwhile run
+# unprofiled. Profiling never fails a request. Sampled reports cover other
+# users' traffic, so their SQL parameters and query strings are left out.
+
+logger = logging.getLogger(__name__)
+
+REPORT_ID = re.compile(r'^[0-9]{8}T[0-9]{6}-[0-9a-f]{8}$')
+TOP_FUNCTIONS = 40
+
+
+def profiles_dir():
+    return getattr(settings, 'PROFILING_DIR', os.path.join(settings.BASE_DIR, 'profiles'))
+
+
+def report_path(report_id, ext):
+    if not REPORT_ID.match(report_id):
+        raise ValueError('Invalid report id')
+    return os.path.join(profiles_dir(), f'{report_id}.{ext}')
+
+
+def list_reports():
+    """Summaries of the stored reports, newest first."""
+    directory = profiles_dir()
+    if not os.path.isdir(directory):
+        return []
+    reports = []
+    for name in sorted(os.listdir(directory), reverse=True):
+        if name.endswith('.json'):
+            with open(os.path.join(directory, name)) as f:
+                report = json.load(f)
+            reports.append({k: report[k] for k in ('id', 'created_at', 'method', 'path', 'user_id', 'status', 'seconds', 'query_count', 'reason')})
+    return reports
+
+
+class SQLRecorder:
+    """execute_wrapper that keeps each statement with its duration.
+
+    With `redact`, parameter values are not kept.
+    """
+
+    def __init__(self, redact=False):
+        self.queries = []
+        self.redact = redact
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries.append({
+                'db': context['connection'].alias,
+                'sql': sql,
+                'params': '<redacted>' if self.redact else repr(params)[:200],
+                'many': many,
+                'ms': round((time.perf_counter() - start) * 1000, 3),
+            })
+
+
+_profiling = threading.Lock()
+
+
+@contextmanager
+def _recording(reason):
+    """Profile the block and record its SQL; yields (recorder, profiler), or
+    None when another profile is already running in this process."""
+    if not _profiling.acquire(blocking=False):
+        yield None
+        return
+    try:
+        recorder, profiler = SQLRecorder(redact=reason == 'sampled'), cProfile.Profile()
+        try:
+            profiler.enable()
+        except ValueError:
+            # Another profiling tool (a debugger, coverage) holds the hook
+            yield None
+            return
+        try:
+            with ExitStack() as stack:
+                for alias in connections:
+                    stack.enter_context(connections[alias].execute_wrapper(recorder))
+                yield recorder, profiler
+        finally:
+            profiler.disable()
+    finally:
+        _profiling.release()
+
+
+class ProfilingMiddleware:
+    """Under ASGI the SQL is recorded in full, but before Python 3.12 cProfile
+    only sees the event-loop thread, not the sync views run off it."""
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        reason = self._reason(request)
+        if reason is None:
+            return self.get_response(request)
+        start = time.perf_counter()
+        with _recording(reason) as session:
+            response = self.get_response(request)
+        if session is not None:
+            self._attach(request, response, reason, time.perf_counter() - start, *session)
+        return response
+
+    async def __acall__(self, request):
+        reason = await sync_to_async(self._reason)(request)
+        if reason is None:
+            return await self.get_response(request)
+        start = time.perf_counter()
+        with _recording(reason) as session:
+            response = await self.get_response(request)
+        if session is not None:
+            await sync_to_async(self._attach)(request, response, reason, time.perf_counter() - start, *session)
+        return response
+
+    def _attach(self, request, response, reason, seconds, recorder, profiler):
+        try:
+            response['X-Profile-Id'] = self._save(request, response, reason, seconds, recorder, profiler)
+        except Exception:
+            logger.exception('Saving the profile of %s %s failed', request.method, request.path)
+
+    def _reason(self, request):
+        """Why this request is profiled, or None."""
+        if request.GET.get('profile') == '1' or request.headers.get('X-Profile') == '1':
+            return 'requested' if self._is_staff(request) else None
+        rate = getattr(settings, 'PROFILING_SAMPLE_RATE', 0)
+        if rate and random.random() < rate:
+            return 'sampled'
+        return None
+
+    def _is_staff(self, request):
+        # DRF authenticates in the view, after middleware, so check the
+        # bearer token here (session users come from AuthenticationMiddleware)
+        user = getattr(request, 'user', None)
+        if user is not None and user.is_authenticated:
+            return user.is_staff
+        try:
+            result = JWTAuthentication().authenticate(request)
+        except APIException:
+            return False
+        return result is not None and result[0].is_staff
+
+    def _save(self, request, response, reason, seconds, recorder, profiler):
+        now = timezone.now()
+        report_id = f'{now:%Y%m%dT%H%M%S}-{secrets.token_hex(4)}'
+        os.makedirs(profiles_dir(), exist_ok=True)
+        profiler.dump_stats(report_path(report_id, 'pstats'))
+
+        out = io.StringIO()
+        stats = pstats.Stats(profiler, stream=out)
+        stats.sort_stats('cumulative').print_stats(TOP_FUNCTIONS)
+        stats.print_callees(TOP_FUNCTIONS // 2)
+        user = getattr(request, 'user', None)
+        report = {
+            'id': report_id,
+            'created_at': now.isoformat(),
+            'reason': reason,
+            'method': request.method,
+            'path': request.path if reason == 'sampled' else request.get_full_path(),
+            'user_id': user.id if user is not None and user.is_authenticated else None,
+            'status': response.status_code,
+            'seconds': round(seconds, 4),
+            'query_count': len(recorder.queries),
+            'query_ms': round(sum(q['ms'] for q in recorder.queries), 3),
+            'queries': recorder.queries,
+            'profile': out.getvalue(),
+        }
+        with open(report_path(report_id, 'json'), 'w') as f:
+            json.dump(report, f, indent=1)
+        self._prune()
+        return report_id
+
+    def _prune(self):
+        keep = getattr(settings, 'PROFILING_MAX_REPORTS', 200)
+        directory = profiles_dir()
+        ids = sorted(name[:-5] for name in os.listdir(directory) if name.endswith('.json'))
+        for report_id in ids[:-keep] if len(ids) > keep else []:
+            for ext in ('json', 'pstats'):
+                try:
+                    os.remove(report_path(report_id, ext))
+                except FileNotFoundError:
+                    pass
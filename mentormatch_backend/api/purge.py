@@ -0,0 +1,97 @@
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import User, Swipe, Match, Message, Media, MatchScore, VerificationRequest
+
+# Accounts whose deletion was scheduled more than ACCOUNT_DELETION_GRACE_DAYS
+# ago are removed piece by piece: every step deletes at most `batch_size`
+# rows per transaction, so no single write holds the database lock for
+# long, and a step simply repeats until nothing is left. An interrupted
+# purge therefore resumes where it stopped the next time it runs; the user
+# row itself goes last.
+
+
+def grace_period():
+    return timedelta(days=getattr(settings, 'ACCOUNT_DELETION_GRACE_DAYS', 7))
+
+
+def due_accounts(now=None):
+    """Users whose grace period has run out, oldest request first."""
+    cutoff = (now or timezone.now()) - grace_period()
+    return User.objects.filter(deletion_scheduled_at__lte=cutoff).order_by('deletion_scheduled_at', 'id')
+
+
+def _steps(user_id):
+    """(label, queryset) of everything removed with an account, in deletion order."""
+    matches = Match.objects.filter(Q(user1_id=user_id) | Q(user2_id=user_id))
+    return [
+        # Whole conversations go with the match, both sides' messages
+        ('messages', Message.objects.filter(match__in=matches.values('id'))),
+        ('matches', matches),
+        ('swipes', Swipe.objects.filter(Q(from_user_id=user_id) | Q(to_user_id=user_id))),
+        ('match scores', MatchScore.objects.filter(Q(user_id=user_id) | Q(candidate_id=user_id))),
+        # Files are released after commit by the Media post_delete handler
+        ('media', Media.objects.filter(user_id=user_id)),
+        ('verification requests', VerificationRequest.objects.filter(user_id=user_id)),
+    ]
+
+
+def _delete_in_batches(qs, batch_size, pause):
+    model = qs.model
+    total = 0
+    while True:
+        # Read the batch outside the write transaction: on SQLite a
+        # transaction that reads before writing can fail with "database is
+        # locked" instead of waiting when another connection writes first.
+        ids = list(qs.order_by('pk').values_list('pk', flat=True)[:batch_size])
+        if not ids:
+            return total
+        names = []
+        if model is VerificationRequest:
+            names = list(model.objects.filter(pk__in=ids).exclude(document='').values_list('document', flat=True))
+        # QuerySet.delete() runs its cascades and signals in one transaction
+        model.objects.filter(pk__in=ids).delete()
+        _delete_files(names)
+        total += len(ids)
+        if pause:
+            time.sleep(pause)
+
+
+def _delete_files(names):
+    for name in names:
+        default_storage.delete(name)
+
+
+def purge_account(user, batch_size=500, pause=0, stdout=None):
+    """Delete `user` and everything attached to it, `batch_size` rows per transaction."""
+    for label, qs in _steps(user.id):
+        deleted = _delete_in_batches(qs, batch_size, pause)
+        if deleted and stdout:
+            stdout.write(f'  {user.username}: {deleted} {label}')
+    document = user.verification_document.name if user.verification_document else None
+    # What is left is small: skill/hobby links, admin log entries, the row itself
+    user.delete()
+    if document:
+        _delete_files([document])
+
+
+def purge_due_accounts(batch_size=500, pause=0, limit=None, stdout=None, now=None):
+    """Purge every account past its grace period; returns how many were removed.
+
+    Safe to run from cron or a task queue at any interval, and to interrupt.
+    """
+    accounts = due_accounts(now)
+    if limit:
+        accounts = accounts[:limit]
+    purged = 0
+    for user in accounts:
+        if stdout:
+            stdout.write(f'Purging {user.username} (id {user.id}, scheduled {user.deletion_scheduled_at:%Y-%m-%d})')
+        purge_account(user, batch_size=batch_size, pause=pause, stdout=stdout)
+        purged += 1
+    return purged
@@ -0,0 +1,106 @@
+import logging
+import time
+from contextlib import ExitStack, contextmanager
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import connections
+
+logger = logging.getLogger(__name__)
+
+
+class QueryBudgetExceeded(AssertionError):
+    pass
+
+
+class QueryCounter:
+    """Counts and times the SQL run while the block is active, on the
+    `using` connection or, by default, on every database (replicas too).
+
+        with QueryCounter() as counter:
+            ...
+        counter.count, counter.seconds
+    """
+
+    def __init__(self, using=None):
+        self.using = using
+        self.count = 0
+        self.seconds = 0.0
+        self._stack = None
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.count += 1
+            self.seconds += time.perf_counter() - start
+
+    def __enter__(self):
+        self._stack = ExitStack()
+        for alias in [self.using] if self.using else connections:
+            self._stack.enter_context(connections[alias].execute_wrapper(self))
+        return self
+
+    def __exit__(self, *exc):
+        self._stack.__exit__(*exc)
+
+
+@contextmanager
+def query_budget(limit, using=None):
+    """Fail if the block runs more than `limit` queries.
+
+    Meant for tests:
+
+        with query_budget(MatchListView.query_budget):
+            client.get('/api/matches/')
+    """
+    with QueryCounter(using) as counter:
+        yield counter
+    if counter.count > limit:
+        raise QueryBudgetExceeded(f'{counter.count} queries run, budget is {limit}')
+
+
+class QueryBudgetMiddleware:
+    """Checks each request against the `query_budget` (or per-method
+    `query_budgets`) declared on its view.
+
+    Over-budget requests are logged, or raise QueryBudgetExceeded when
+    settings.QUERY_BUDGET_STRICT is on (useful in development and CI).
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        with QueryCounter() as counter:
+            response = self.get_response(request)
+        self._check(request, counter)
+        return response
+
+    async def __acall__(self, request):
+        with QueryCounter() as counter:
+            response = await self.get_response(request)
+        self._check(request, counter)
+        return response
+
+    def _check(self, request, counter):
+        budget = getattr(request, '_query_budget', None)
+        if budget is not None and counter.count > budget:
+            message = f'{request.method} {request.path} ran {counter.count} queries, budget is {budget}'
+            if getattr(settings, 'QUERY_BUDGET_STRICT', False):
+                raise QueryBudgetExceeded(message)
+            logger.warning(message)
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        view_class = getattr(view_func, 'view_class', None)
+        # `query_budgets` ({'GET': n, 'POST': m}) overrides `query_budget` per method
+        budgets = getattr(view_class, 'query_budgets', {})
+        request._query_budget = budgets.get(request.method, getattr(view_class, 'query_budget', None))
@@ -0,0 +1,106 @@
+import asyncio
+import threading
+from abc import ABC, abstractmethod
+from collections import defaultdict
+
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+# Pub/sub used to wake long-polling chat clients (see views.message_stream)
+# as soon as a message is saved. Publishing happens from synchronous code
+# (the request that saved the message); subscribers wait on an event loop.
+#
+# The default InProcessBroker only reaches waiters in the same process. With
+# several worker processes a waiter in another process simply times out and
+# re-reads the database, so nothing is lost; set CHAT_BROKER to a
+# broker-backed implementation (e.g. Redis pub/sub) to wake them too.
+
+
+class Broker(ABC):
+    """Interface for chat brokers."""
+
+    @abstractmethod
+    def publish(self, channel, payload):
+        """Deliver `payload` to the current subscribers of `channel`. Never blocks."""
+
+    @abstractmethod
+    def subscribe(self, channel):
+        """Return a Subscription; must be called from a running event loop."""
+
+
+class Subscription(ABC):
+    @abstractmethod
+    async def wait(self, timeout):
+        """Return the next payload, or None after `timeout` seconds."""
+
+    @abstractmethod
+    def close(self):
+        """Stop receiving payloads."""
+
+
+class InProcessBroker(Broker):
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subscribers = defaultdict(set)
+
+    def publish(self, channel, payload):
+        with self._lock:
+            subscribers = list(self._subscribers.get(channel, ()))
+        for subscription in subscribers:
+            subscription.deliver(payload)
+
+    def subscribe(self, channel):
+        subscription = _LocalSubscription(self, channel, asyncio.get_running_loop())
+        with self._lock:
+            self._subscribers[channel].add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            subscribers = self._subscribers.get(subscription.channel)
+            if subscribers is not None:
+                subscribers.discard(subscription)
+                if not subscribers:
+                    del self._subscribers[subscription.channel]
+
+
+class _LocalSubscription(Subscription):
+    def __init__(self, broker, channel, loop):
+        self.broker = broker
+        self.channel = channel
+        self._loop = loop
+        self._queue = asyncio.Queue()
+
+    def deliver(self, payload):
+        try:
+            self._loop.call_soon_threadsafe(self._queue.put_nowait, payload)
+        except RuntimeError:
+            # The waiting request already finished and its loop is closed
+            self.close()
+
+    async def wait(self, timeout):
+        try:
+            return await asyncio.wait_for(self._queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+    def close(self):
+        self.broker.unsubscribe(self)
+
+
+_broker = None
+_broker_lock = threading.Lock()
+
+
+def get_broker():
+    global _broker
+    if _broker is None:
+        with _broker_lock:
+            if _broker is None:
+                path = getattr(settings, 'CHAT_BROKER', 'api.realtime.InProcessBroker')
+                _broker = import_string(path)()
+    return _broker
+
+
+def match_channel(match_id):
+    return f'match:{match_id}'
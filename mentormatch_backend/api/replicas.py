@@ -0,0 +1,81 @@
+import random
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.core.cache import cache
+from rest_framework.permissions import SAFE_METHODS
+
+# Read replicas. GET requests to views using ReplicaReadMixin read from one
+# alias of DATABASE_REPLICAS, picked per request so every query of the
+# request sees the same replica; all other reads and every write go to
+# "default". After a user swipes or posts a message their reads stay on the
+# primary for REPLICA_STICKY_SECONDS, so replication lag never hides their
+# own writes from them. The sticky flag lives in the cache, which must be
+# shared (Redis/Memcached) when several workers run.
+
+_replica = ContextVar('api_replica', default=None)
+
+
+def replica_aliases():
+    return getattr(settings, 'DATABASE_REPLICAS', [])
+
+
+def sticky_key(user_id):
+    return f'replica-sticky:{user_id}'
+
+
+def stick_to_primary(user_id):
+    """Serve `user_id`'s reads from the primary for a while; call after a write."""
+    if replica_aliases():
+        cache.set(sticky_key(user_id), True, getattr(settings, 'REPLICA_STICKY_SECONDS', 10))
+
+
+@contextmanager
+def reads_from(alias):
+    """Route reads in the block to `alias`; None means the primary."""
+    token = _replica.set(alias)
+    try:
+        yield
+    finally:
+        _replica.reset(token)
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        return _replica.get()
+
+    def db_for_write(self, model, **hints):
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Replicas hold the same rows as the primary
+        pool = {'default', *replica_aliases()}
+        if obj1._state.db in pool and obj2._state.db in pool:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, **hints):
+        # Replicas get their schema from the primary
+        if db in replica_aliases():
+            return False
+        return None
+
+
+class ReplicaReadMixin:
+    """For API views whose GETs may be served from a read replica."""
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        aliases = replica_aliases()
+        if (aliases and request.method in SAFE_METHODS and request.user.is_authenticated
+                and not cache.get(sticky_key(request.user.id))):
+            self._replica_token = _replica.set(random.choice(aliases))
+
+    def dispatch(self, request, *args, **kwargs):
+        self._replica_token = None
+        try:
+            return super().dispatch(request, *args, **kwargs)
+        finally:
+            if self._replica_token is not None:
+                _replica.reset(self._replica_token)
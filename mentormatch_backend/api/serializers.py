@@ -1,21 +1,43 @@
 from rest_framework import serializers
 from .models import User, Skill, Hobby, Swipe, Match, Message, Media
 from django.contrib.auth.password_validation import validate_password
+from .matching import request_score_refresh, score_inputs
+from .metrics import TimedSerializerMixin
+from .media import schedule_variants, signed_file_url, store_upload, variant_names
+from .vocabulary import assign
 
 # Serializers translate between Python/Django objects and JSON for the API.
 # They also validate incoming data and can create/update model instances.
 
-class SkillSerializer(serializers.ModelSerializer):
+# Bases for every serializer below, so api.metrics sees their time
+class ModelSerializer(TimedSerializerMixin, serializers.ModelSerializer):
+    pass
+
+class Serializer(TimedSerializerMixin, serializers.Serializer):
+    pass
+
+class SkillSerializer(ModelSerializer):
     class Meta:
         model = Skill
         fields = ['id', 'name']
 
-class HobbySerializer(serializers.ModelSerializer):
+class HobbySerializer(ModelSerializer):
     class Meta:
         model = Hobby
         fields = ['id', 'name']
 
-class UserSerializer(serializers.ModelSerializer):
+# Relations UserSerializer reads. Prefetch them (see user_prefetch) whenever
+# many users are serialized, otherwise each user costs three extra queries.
+USER_RELATIONS = ('skills_offered', 'skills_needed', 'hobbies')
+
+
+def user_prefetch(path=''):
+    """Prefetch lookups for a UserSerializer nested at `path` (e.g. 'sender')."""
+    prefix = f'{path}__' if path else ''
+    return [prefix + rel for rel in USER_RELATIONS]
+
+
+class UserSerializer(ModelSerializer):
     skills_offered = SkillSerializer(many=True, read_only=True)
     skills_needed = SkillSerializer(many=True, read_only=True)
     hobbies = HobbySerializer(many=True, read_only=True)
@@ -43,7 +65,31 @@ class UserSerializer(serializers.ModelSerializer):
                 data.pop('date_of_birth', None)
         return data
 
-class RegisterSerializer(serializers.ModelSerializer):
+def user_card(user):
+    """Compact user representation for high-volume lists (messages, matches).
+
+    Built as a plain dict; the full profile is available from /api/users/<id>/.
+    """
+    return {
+        'id': user.id,
+        'username': user.username,
+        'role': user.role,
+        'is_verified': user.is_verified,
+    }
+
+
+class UserCardField(serializers.Field):
+    """Read-only nested user rendered with user_card()."""
+
+    def __init__(self, **kwargs):
+        kwargs['read_only'] = True
+        super().__init__(**kwargs)
+
+    def to_representation(self, value):
+        return user_card(value)
+
+
+class RegisterSerializer(ModelSerializer):
     password = serializers.CharField(write_only=True, required=True, validators=[validate_password])
     password2 = serializers.CharField(write_only=True, required=True)
 
@@ -64,7 +110,7 @@ class RegisterSerializer(serializers.ModelSerializer):
         user.save()
         return user
 
-class ProfileUpdateSerializer(serializers.ModelSerializer):
+class ProfileUpdateSerializer(ModelSerializer):
     skills_offered_ids = serializers.ListField(child=serializers.CharField(), write_only=True, required=False)
     skills_needed_ids = serializers.ListField(child=serializers.CharField(), write_only=True, required=False)
     hobby_ids = serializers.ListField(child=serializers.CharField(), write_only=True, required=False)
@@ -82,6 +128,7 @@ class ProfileUpdateSerializer(serializers.ModelSerializer):
         needed_ids = validated_data.pop('skills_needed_ids', [])
         hobby_ids = validated_data.pop('hobby_ids', [])
         verification_file = validated_data.pop('verification_document', None)
+        before = score_inputs(instance)
         for k, v in validated_data.items():
             setattr(instance, k, v)
         if verification_file is not None:
@@ -91,53 +138,69 @@ class ProfileUpdateSerializer(serializers.ModelSerializer):
                 VerificationRequest.objects.create(user=instance, document=verification_file)
                 instance.is_verified = False
         instance.save()
-        from .models import Skill
         if offered_ids is not None:
-            offered = []
-            for name in offered_ids:
-                s, _ = Skill.objects.get_or_create(name=name)
-                offered.append(s)
-            instance.skills_offered.set(offered)
+            assign(instance.skills_offered, Skill, offered_ids)
         if needed_ids is not None:
-            needed = []
-            for name in needed_ids:
-                s, _ = Skill.objects.get_or_create(name=name)
-                needed.append(s)
-            instance.skills_needed.set(needed)
+            assign(instance.skills_needed, Skill, needed_ids)
         if hobby_ids:
-            hobbies = []
-            from .models import Hobby
-            for name in hobby_ids:
-                h, _ = Hobby.objects.get_or_create(name=name)
-                hobbies.append(h)
-            instance.hobbies.set(hobbies)
+            assign(instance.hobbies, Hobby, hobby_ids)
+        if score_inputs(instance) != before:
+            # Keep the precomputed match scores in step with the profile
+            request_score_refresh([instance.id])
         return instance
 
 
-class VerificationRequestSerializer(serializers.ModelSerializer):
-    user = UserSerializer(read_only=True)
+class VerificationRequestSerializer(ModelSerializer):
+    user = UserCardField()
+    reviewer = UserCardField()
 
     class Meta:
         model = __import__('api.models', fromlist=['VerificationRequest']).VerificationRequest
         fields = ['id', 'user', 'document', 'status', 'submitted_at', 'reviewed_at', 'reviewer']
         read_only_fields = ['status', 'submitted_at', 'reviewed_at', 'reviewer']
 
-class SwipeSerializer(serializers.ModelSerializer):
+class SwipeSerializer(ModelSerializer):
     class Meta:
         model = Swipe
         fields = ['id', 'from_user', 'to_user', 'liked', 'timestamp']
         read_only_fields = ['from_user', 'timestamp']
 
-class MatchSerializer(serializers.ModelSerializer):
-    user1 = UserSerializer()
-    user2 = UserSerializer()
+class SwipeBatchItemSerializer(Serializer):
+    to_user = serializers.IntegerField()
+    liked = serializers.BooleanField(default=False)
+
+
+class SwipeBatchSerializer(Serializer):
+    swipes = SwipeBatchItemSerializer(many=True, allow_empty=False, max_length=500)
+
+
+class VerificationBulkSerializer(Serializer):
+    action = serializers.ChoiceField(choices=['approve', 'reject'])
+    ids = serializers.ListField(child=serializers.IntegerField(), allow_empty=False, max_length=10000)
+
+class MatchSerializer(ModelSerializer):
+    user1 = UserCardField()
+    user2 = UserCardField()
 
     class Meta:
         model = Match
         fields = ['id', 'user1', 'user2', 'timestamp']
 
-class MessageSerializer(serializers.ModelSerializer):
-    sender = UserSerializer(read_only=True)
+class InboxSerializer(ModelSerializer):
+    """A conversation as listed in the inbox of the requesting user."""
+    partner = serializers.SerializerMethodField()
+    unread_count = serializers.IntegerField(read_only=True)
+
+    class Meta:
+        model = Match
+        fields = ['id', 'partner', 'last_message_at', 'last_message_preview', 'unread_count', 'timestamp']
+
+    def get_partner(self, match):
+        user = self.context['request'].user
+        return user_card(match.user2 if match.user1_id == user.id else match.user1)
+
+class MessageSerializer(ModelSerializer):
+    sender = UserCardField()
 
     class Meta:
         model = Message
@@ -145,10 +208,31 @@ class MessageSerializer(serializers.ModelSerializer):
         read_only_fields = ['sender', 'timestamp']
 
 
-class MediaSerializer(serializers.ModelSerializer):
+class MediaSerializer(ModelSerializer):
+    url = serializers.SerializerMethodField()
+    variants = serializers.SerializerMethodField()
+
     class Meta:
         model = Media
-        fields = ['id', 'media_type', 'file', 'caption', 'uploaded_at']
+        fields = ['id', 'media_type', 'file', 'url', 'caption', 'uploaded_at', 'processing_status', 'variants']
+        read_only_fields = ['processing_status']
+        # Upload only: files are read through `url`, never the raw MEDIA_URL path
+        extra_kwargs = {'file': {'write_only': True}}
+
+    # `url` and `variants` point at the authorized file endpoint, signed for
+    # the requesting user so they work in <img>/<video> tags.
+    def _signed_url(self, obj, variant=None):
+        request = self.context.get('request')
+        if request is None or not request.user.is_authenticated:
+            return None
+        return request.build_absolute_uri(signed_file_url(obj.id, request.user.id, variant))
+
+    def get_url(self, obj):
+        return self._signed_url(obj)
+
+    def get_variants(self, obj):
+        # Resized copies for galleries; `url` is the full-size original
+        return {variant: self._signed_url(obj, variant) for variant in variant_names(obj)}
 
     def validate(self, attrs):
         f = attrs.get('file')
@@ -172,4 +256,7 @@ class MediaSerializer(serializers.ModelSerializer):
                 validated_data['media_type'] = 'video'
             else:
                 validated_data['media_type'] = 'file'
-        return super().create(validated_data)
+        validated_data['file'], validated_data['content_hash'] = store_upload(validated_data['file'])
+        media = super().create(validated_data)
+        schedule_variants(media)
+        return media
@@ -0,0 +1,60 @@
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete, pre_save
+from django.db import transaction
+from django.dispatch import receiver
+
+from .models import User, Skill, Hobby, Match, Media
+from .profile_cache import invalidate_profiles
+from . import media, vocabulary
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def user_changed(sender, instance, **kwargs):
+    invalidate_profiles([instance.id])
+
+
+def profile_relation_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if action not in ('post_add', 'post_remove', 'pre_clear'):
+        return
+    if not reverse:
+        invalidate_profiles([instance.id])
+    elif pk_set is not None:
+        invalidate_profiles(pk_set)
+    else:
+        # Cleared from the Skill/Hobby side: everyone linked to it
+        target = 'hobby' if isinstance(instance, Hobby) else 'skill'
+        invalidate_profiles(sender.objects.filter(**{target: instance}).values_list('user_id', flat=True))
+
+
+for _through in (User.skills_offered.through, User.skills_needed.through, User.hobbies.through):
+    m2m_changed.connect(profile_relation_changed, sender=_through)
+
+
+@receiver(pre_save, sender=Skill)
+@receiver(pre_save, sender=Hobby)
+@receiver(pre_delete, sender=Skill)
+@receiver(pre_delete, sender=Hobby)
+def vocabulary_changed(sender, instance, **kwargs):
+    # Skill/hobby names are embedded in cached profiles and the name -> id cache
+    if instance.pk is None:
+        return
+    vocabulary.forget(sender, instance.pk)
+    if sender is Skill:
+        user_ids = set(instance.offered_by.values_list('id', flat=True)) | set(instance.needed_by.values_list('id', flat=True))
+    else:
+        user_ids = instance.user_set.values_list('id', flat=True)
+    invalidate_profiles(user_ids)
+
+
+@receiver(post_delete, sender=Media)
+def media_deleted(sender, instance, **kwargs):
+    # Stored files are shared between identical uploads (see api/media.py)
+    name, content_hash = instance.file.name, instance.content_hash
+    transaction.on_commit(lambda: media.release_file(name, content_hash))
+
+
+@receiver(post_save, sender=Match)
+@receiver(post_delete, sender=Match)
+def match_changed(sender, instance, **kwargs):
+    # Matches decide who may see a user's media (cached in api/media.py)
+    media.forget_media_access(instance.user1_id, instance.user2_id)
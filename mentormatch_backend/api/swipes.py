@@ -0,0 +1,64 @@
+from django.db import transaction
+from django.db.models import Q
+
+from .media import forget_media_access
+from .models import User, Swipe, Match
+
+# Swipe -> match detection must not lose a match when two users like each
+# other at the same time. Each call is one transaction that writes its swipes
+# first and then locks the rows of everyone involved in id order, so two
+# concurrent calls for the same pair are serialized and the second one sees
+# the first one's swipe. (SQLite ignores SELECT ... FOR UPDATE, but there
+# the initial write already serializes writers.) Matches are inserted with
+# ignore_conflicts, so a duplicate never raises IntegrityError.
+
+
+def record_swipes(from_user, swipes):
+    """Store swipes from `from_user` and return the matches they complete.
+
+    `swipes` is an iterable of (to_user_id, liked); a later entry for the same
+    user wins. Runs a fixed number of queries whatever the batch size.
+    Returns (matches, unknown_user_ids); `matches` holds the match of every
+    mutual like in `swipes`, whether this call created it or it already
+    existed (as SwipeView always answered a repeated like).
+    """
+    latest = {}
+    for to_user_id, liked in swipes:
+        latest[to_user_id] = bool(liked)
+    latest.pop(from_user.id, None)
+    existing = set(User.objects.filter(id__in=list(latest)).values_list('id', flat=True))
+    unknown = sorted(uid for uid in latest if uid not in existing)
+    latest = {uid: liked for uid, liked in latest.items() if uid in existing}
+    if not latest:
+        return [], unknown
+
+    with transaction.atomic():
+        Swipe.objects.bulk_create(
+            [Swipe(from_user=from_user, to_user_id=uid, liked=liked) for uid, liked in latest.items()],
+            update_conflicts=True,
+            unique_fields=['from_user', 'to_user'],
+            update_fields=['liked'],
+        )
+        liked_ids = [uid for uid, liked in latest.items() if liked]
+        if not liked_ids:
+            return [], unknown
+        list(User.objects.select_for_update().filter(id__in=[from_user.id, *liked_ids]).order_by('id').values_list('id'))
+        mutual = list(
+            Swipe.objects.filter(from_user_id__in=liked_ids, to_user=from_user, liked=True)
+            .values_list('from_user_id', flat=True)
+        )
+        if not mutual:
+            return [], unknown
+        with_user = lambda ids: Q(user1=from_user, user2_id__in=ids) | Q(user2=from_user, user1_id__in=ids)
+        # Read under the lock, so a concurrent call cannot create one in between
+        matched = {u1 if u2 == from_user.id else u2 for u1, u2 in Match.objects.filter(with_user(mutual)).values_list('user1_id', 'user2_id')}
+        new = [uid for uid in mutual if uid not in matched]
+        if new:
+            Match.objects.bulk_create(
+                [Match(user1_id=min(from_user.id, uid), user2_id=max(from_user.id, uid)) for uid in new],
+                ignore_conflicts=True,
+            )
+            # bulk_create sends no post_save, so drop cached media access here
+            transaction.on_commit(lambda: [forget_media_access(from_user.id, uid) for uid in new])
+        matches = list(Match.objects.filter(with_user(mutual)).select_related('user1', 'user2'))
+    return matches, unknown
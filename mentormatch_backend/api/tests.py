@@ -0,0 +1,899 @@
+import io
+import json
+import os
+import shutil
+import tempfile
+import time
+from datetime import timedelta
+from unittest import mock
+
+from django.core.cache import cache
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import connection, transaction
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from PIL import Image
+from rest_framework.test import APITestCase
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from .matching import candidate_queryset, rebuild_match_scores, refresh_match_scores, score_candidates, top_candidates
+from .media import generate_variants
+from .purge import purge_due_accounts
+from .models import User, Hobby, Match, MatchScore, MatchScoreRefresh, Media, Message, Skill, Swipe, VerificationRequest
+from .querybudget import query_budget
+from .swipes import record_swipes
+from . import profiling, realtime, replicas, vocabulary
+from .metrics import registry
+
+
+class BearerClientMixin:
+    """Authenticates like the frontend does, so the JWT user lookup is counted."""
+
+    def authenticate(self, user):
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {RefreshToken.for_user(user).access_token}')
+
+
+@override_settings(QUERY_BUDGET_STRICT=True)
+class MessageBudgetTests(BearerClientMixin, APITestCase):
+    def setUp(self):
+        self.student = User.objects.create_user('student', password='pw', role='student')
+        self.professional = User.objects.create_user('professional', password='pw', role='professional')
+        self.match = Match.objects.create(user1=self.student, user2=self.professional)
+        self.authenticate(self.student)
+
+    def test_send_message_within_budget(self):
+        response = self.client.post(
+            f'/api/messages/{self.match.id}/', {'match': self.match.id, 'content': 'hello'}, format='json',
+        )
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(Message.objects.filter(match=self.match).count(), 1)
+
+    def test_list_messages_within_budget(self):
+        response = self.client.get(f'/api/messages/{self.match.id}/')
+        self.assertEqual(response.status_code, 200)
+
+
+@override_settings(QUERY_BUDGET_STRICT=True)
+class EndpointBudgetTests(BearerClientMixin, APITestCase):
+    """Every view with a query_budget, run once with strict budgets on."""
+
+    def setUp(self):
+        self.student = User.objects.create_user('student', password='pw', role='student', city='Austin', country='USA')
+        self.professional = User.objects.create_user('professional', password='pw', role='professional',
+                                                     city='Austin', country='USA')
+        self.others = [
+            User.objects.create_user(f'pro{i}', password='pw', role='professional', city='Austin', country='USA')
+            for i in range(3)
+        ]
+        self.match = Match.objects.create(user1=self.student, user2=self.professional)
+        self.authenticate(self.student)
+
+    def test_potential_matches(self):
+        for params in ('?limit=2', '?global=1&limit=2', ''):
+            response = self.client.get(f'/api/potential/{params}')
+            self.assertEqual(response.status_code, 200, params)
+
+    def test_verification_queue(self):
+        staff = User.objects.create_user('staff', password='pw', is_staff=True)
+        VerificationRequest.objects.create(user=self.professional)
+        self.authenticate(staff)
+        response = self.client.get('/api/verification/?limit=10')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data['results']), 1)
+
+    def test_swipe(self):
+        response = self.client.post('/api/swipe/', {'to_user': self.others[0].id, 'liked': True}, format='json')
+        self.assertEqual(response.status_code, 200)
+
+    def test_swipe_batch(self):
+        swipes = [{'to_user': u.id, 'liked': True} for u in self.others]
+        response = self.client.post('/api/swipe/batch/', {'swipes': swipes}, format='json')
+        self.assertEqual(response.status_code, 200)
+
+    def test_matches(self):
+        response = self.client.get('/api/matches/')
+        self.assertEqual(response.status_code, 200)
+
+    def test_inbox(self):
+        self.client.post(f'/api/messages/{self.match.id}/', {'match': self.match.id, 'content': 'hi'}, format='json')
+        response = self.client.get('/api/inbox/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data['results']), 1)
+
+    def test_mark_read(self):
+        Message.objects.create(match=self.match, sender=self.professional, content='hi')
+        response = self.client.post(f'/api/messages/{self.match.id}/read/')
+        self.assertEqual(response.status_code, 200)
+
+    def test_media_file(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        with self.settings(MEDIA_ROOT=media_root):
+            media = Media.objects.create(user=self.professional, media_type='file',
+                                         file=SimpleUploadedFile('notes.txt', b'notes'))
+            response = self.client.get(f'/api/media/file/{media.id}/')
+        self.assertEqual(response.status_code, 200)
+
+
+class RecordSwipesTests(BearerClientMixin, APITestCase):
+    def setUp(self):
+        self.student = User.objects.create_user('student', password='pw', role='student')
+        self.pros = [User.objects.create_user(f'pro{i}', password='pw', role='professional') for i in range(3)]
+
+    def liked(self, to_user):
+        return Swipe.objects.get(from_user=self.student, to_user=to_user).liked
+
+    def test_form_encoded_false_is_a_dislike(self):
+        self.authenticate(self.student)
+        response = self.client.post('/api/swipe/', {'to_user': self.pros[0].id, 'liked': 'false'})
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(self.liked(self.pros[0]))
+        self.client.post('/api/swipe/', {'to_user': self.pros[0].id, 'liked': 'true'})
+        self.assertTrue(self.liked(self.pros[0]))
+
+    def test_boolean_liked(self):
+        self.authenticate(self.student)
+        swipes = [{'to_user': self.pros[0].id, 'liked': True}, {'to_user': self.pros[1].id, 'liked': False}]
+        response = self.client.post('/api/swipe/batch/', {'swipes': swipes}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(self.liked(self.pros[0]))
+        self.assertFalse(self.liked(self.pros[1]))
+
+    def test_invalid_liked_is_rejected(self):
+        self.authenticate(self.student)
+        response = self.client.post('/api/swipe/', {'to_user': self.pros[0].id, 'liked': 'maybe'})
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(Swipe.objects.exists())
+
+    def test_later_duplicate_wins(self):
+        pro = self.pros[0]
+        record_swipes(pro, [(self.student.id, True)])
+        matches, unknown = record_swipes(self.student, [(pro.id, True), (pro.id, False)])
+        self.assertEqual((matches, unknown), ([], []))
+        self.assertEqual(Swipe.objects.filter(from_user=self.student).count(), 1)
+        self.assertFalse(self.liked(pro))
+
+        matches, _ = record_swipes(self.student, [(pro.id, False), (pro.id, True)])
+        self.assertEqual([{m.user1_id, m.user2_id} for m in matches], [{self.student.id, pro.id}])
+
+    def test_returns_new_and_existing_matches(self):
+        for pro in self.pros:
+            record_swipes(pro, [(self.student.id, True)])
+        first, _ = record_swipes(self.student, [(self.pros[0].id, True)])
+        self.assertEqual(len(first), 1)
+
+        matches, unknown = record_swipes(self.student, [(pro.id, True) for pro in self.pros] + [(0, True)])
+        self.assertEqual(unknown, [0])
+        self.assertEqual(sorted(m.id for m in matches), sorted(Match.objects.values_list('id', flat=True)))
+        self.assertEqual(Match.objects.count(), 3)
+
+    def test_fixed_queries_whatever_the_batch_size(self):
+        many = [User.objects.create_user(f'more{i}', password='pw', role='professional') for i in range(20)]
+        for pro in many:
+            record_swipes(pro, [(self.student.id, True)])
+        for batch in (many[:1], many[1:]):
+            # Lookup, savepoint, swipes, lock, mutual likes, matches: check, insert, read, release
+            with query_budget(9):
+                matches, _ = record_swipes(self.student, [(u.id, True) for u in batch])
+            self.assertEqual(len(matches), len(batch))
+
+    def test_repeated_like_returns_existing_match(self):
+        pro = self.pros[0]
+        record_swipes(pro, [(self.student.id, True)])
+        self.authenticate(self.student)
+        first = self.client.post('/api/swipe/', {'to_user': pro.id, 'liked': True}).json()
+        again = self.client.post('/api/swipe/', {'to_user': pro.id, 'liked': True}).json()
+        self.assertTrue(again['matched'])
+        self.assertEqual(again['match']['id'], first['match']['id'])
+        self.assertEqual(Match.objects.count(), 1)
+
+    def test_stress_command_keeps_existing_users(self):
+        User.objects.create_user('stress_alice', password='pw', role='student')
+        with self.assertRaises(CommandError):
+            call_command('stress_swipes', in_place=True, pairs=2, threads=1, stdout=mock.Mock())
+        self.assertEqual(list(User.objects.filter(username__startswith='stress_').values_list('username', flat=True)),
+                         ['stress_alice'])
+
+
+def set_score(user, candidate, verified_bonus):
+    """The original set-based scoring, kept as the reference for the bitmask version."""
+    names = lambda u, rel: {n.lower() for n in getattr(u, rel).values_list('name', flat=True)}
+    user_offered, user_needed = names(user, 'skills_offered'), names(user, 'skills_needed')
+    cs_offered, cs_needed = names(candidate, 'skills_offered'), names(candidate, 'skills_needed')
+    cross_teach_overlap = len(user_needed & cs_offered) + len(user_offered & cs_needed)
+    synergy = len(user_offered & cs_offered) + len(user_needed & cs_needed)
+    score = (cross_teach_overlap / (len(user_needed | cs_offered) or 1) * 0.7
+             + cross_teach_overlap / (len(user_offered | cs_needed) or 1) * 0.2
+             + synergy / ((len(user_offered) + len(user_needed)) or 1) * 0.1)
+    if verified_bonus:
+        score += 0.1
+    return min(100, round(score * 100))
+
+
+class ScoringTests(TestCase):
+    def test_bitmask_scores_match_set_scores(self):
+        skills = [Skill.objects.create(name=n) for n in ('Python', 'python ', 'Go', 'GO', 'Rust', 'SQL')]
+        student = User.objects.create_user('student', password='pw', role='student')
+        student.skills_offered.set(skills[4:6])
+        student.skills_needed.set(skills[0:3])
+        pros = []
+        for i, (offered, needed) in enumerate([
+            ([0, 3], [5]), ([1], []), ([3, 4], [0, 4, 5]), ([], []), ([2, 3], [3]),
+        ]):
+            pro = User.objects.create_user(f'pro{i}', password='pw', role='professional', is_verified=i % 2 == 0)
+            pro.skills_offered.set([skills[j] for j in offered])
+            pro.skills_needed.set([skills[j] for j in needed])
+            pros.append(pro)
+        scored = score_candidates(student, User.objects.filter(id__in=[p.id for p in pros]).order_by('id'))
+        self.assertEqual([c.id for c, _ in scored], [p.id for p in pros])
+        self.assertEqual([s for _, s in scored], [set_score(student, p, p.is_verified) for p in pros])
+        self.assertNotEqual(len({s for _, s in scored}), 1)
+
+
+@override_settings(MATCH_SCORE_TOP_N=2, QUERY_BUDGET_STRICT=True)
+class StoredScoreTests(BearerClientMixin, APITestCase):
+    """The stored-score deck must rank exactly like live scoring."""
+
+    def setUp(self):
+        skills = [Skill.objects.create(name=name) for name in ('python', 'design', 'sql', 'go')]
+        self.student = User.objects.create_user('student', password='pw', role='student', city='Austin', country='USA')
+        self.student.skills_needed.set(skills[:3])
+        self.student.skills_offered.set(skills[3:])
+        self.pros = []
+        for i, offered in enumerate([skills[:1], skills[:2], skills[:3], skills[1:2], skills[3:], []]):
+            pro = User.objects.create_user(f'pro{i}', password='pw', role='professional', city='Austin',
+                                           country='USA', is_verified=True)
+            pro.skills_offered.set(offered)
+            self.pros.append(pro)
+        rebuild_match_scores()
+        self.authenticate(self.student)
+
+    def deck(self):
+        results, cursor = [], None
+        while True:
+            response = self.client.get('/api/potential/', {'limit': 2, **({'cursor': cursor} if cursor else {})})
+            self.assertEqual(response.status_code, 200)
+            results += [(r['user']['id'], r['score']) for r in response.data['results']]
+            cursor = response.data['next_cursor']
+            if cursor is None:
+                return results
+
+    def live(self):
+        return [(c.id, score) for c, score in top_candidates(self.student, candidate_queryset(self.student))]
+
+    def test_deck_matches_live_scoring(self):
+        self.assertEqual(MatchScore.objects.filter(user=self.student).count(), 2)
+        self.assertEqual(self.deck(), self.live())
+
+    def test_deck_past_swiped_stored_rows(self):
+        for c, _ in top_candidates(self.student, candidate_queryset(self.student), limit=2):
+            Swipe.objects.create(from_user=self.student, to_user=c, liked=False)
+        self.assertEqual(self.deck(), self.live())
+        self.assertGreater(len({score for _, score in self.deck()}), 1)
+
+    def test_deck_after_incremental_refresh(self):
+        best = top_candidates(self.student, candidate_queryset(self.student), limit=1)[0][0]
+        best.skills_offered.clear()
+        self.pros[5].skills_offered.set(Skill.objects.filter(name__in=['python', 'sql']))
+        refresh_match_scores([best.id, self.pros[5].id])
+        self.assertEqual(self.deck(), self.live())
+
+
+class MessageStreamTests(TestCase):
+    def setUp(self):
+        student = User.objects.create_user('student', password='pw', role='student')
+        professional = User.objects.create_user('professional', password='pw', role='professional')
+        self.match = Match.objects.create(user1=student, user2=professional)
+        self.headers = {'Authorization': f'Bearer {RefreshToken.for_user(student).access_token}'}
+
+    async def test_rejects_non_finite_timeout(self):
+        for timeout in ('nan', 'inf', '-inf', 'soon'):
+            response = await self.async_client.get(
+                f'/api/messages/{self.match.id}/stream/', {'timeout': timeout}, headers=self.headers,
+            )
+            self.assertEqual(response.status_code, 400, timeout)
+
+    async def test_negative_timeout_returns_at_once(self):
+        response = await self.async_client.get(
+            f'/api/messages/{self.match.id}/stream/', {'timeout': '-5'}, headers=self.headers,
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), [])
+
+    def test_incomplete_broker_cannot_be_created(self):
+        class PublishOnly(realtime.Broker):
+            def publish(self, channel, payload):
+                pass
+
+        with self.assertRaises(TypeError):
+            PublishOnly()
+
+
+class PageCursorTests(BearerClientMixin, APITestCase):
+    def setUp(self):
+        python = Skill.objects.create(name='python')
+        self.student = User.objects.create_user('student', password='pw', role='student', city='Austin', country='USA')
+        self.student.skills_needed.add(python)
+        for i in range(5):
+            pro = User.objects.create_user(f'pro{i}', password='pw', role='professional', city='Austin',
+                                           country='USA', is_verified=True)
+            if i % 2:
+                pro.skills_offered.add(python)
+        rebuild_match_scores()
+        self.authenticate(self.student)
+
+    def test_pages_cover_the_deck_once(self):
+        for params in ({}, {'global': 1}):
+            seen, cursor = [], None
+            while True:
+                response = self.client.get('/api/potential/', {'limit': 2, **params, **({'cursor': cursor} if cursor else {})})
+                self.assertEqual(response.status_code, 200)
+                seen += [r['user']['id'] for r in response.data['results']]
+                cursor = response.data['next_cursor']
+                if cursor is None:
+                    break
+            full = self.client.get('/api/potential/', params).data
+            self.assertEqual(seen, [r['user']['id'] for r in full])
+            self.assertEqual(len(seen), 5)
+
+    def test_bad_cursors_are_rejected(self):
+        for cursor in ('5:99999999999999999999', '99999999999999999999:5', '-1:5', '5:-1', '5', 'a:b', '1:2:3'):
+            for params in ({}, {'global': 1}):
+                response = self.client.get('/api/potential/', {'limit': 2, 'cursor': cursor, **params})
+                self.assertEqual(response.status_code, 400, (cursor, params))
+
+    def test_message_cursors_are_range_checked(self):
+        professional = User.objects.get(username='pro1')
+        match = Match.objects.create(user1=self.student, user2=professional)
+        for param in ('before', 'after'):
+            response = self.client.get(f'/api/messages/{match.id}/', {param: '99999999999999999999'})
+            self.assertEqual(response.status_code, 400, param)
+
+
+class TimeCursorTests(BearerClientMixin, APITestCase):
+    """Inbox and verification queue pages, keyed on (timestamp, id)."""
+
+    BAD_CURSORS = ('a:b', '5', '1:2:3', '1:-1', '1:99999999999999999999', '99999999999999999999:1')
+
+    def setUp(self):
+        self.student = User.objects.create_user('student', password='pw', role='student')
+        self.staff = User.objects.create_user('staff', password='pw', is_staff=True)
+        now = timezone.now()
+        self.matches, self.requests = [], []
+        # Pairs share a timestamp, so pages must also order by id
+        for i in range(5):
+            pro = User.objects.create_user(f'pro{i}', password='pw', role='professional')
+            at = now - timedelta(minutes=i // 2)
+            self.matches.append(Match.objects.create(user1=self.student, user2=pro, last_activity_at=at))
+            request = VerificationRequest.objects.create(user=pro)
+            VerificationRequest.objects.filter(id=request.id).update(submitted_at=at)
+            self.requests.append(request)
+
+    def pages(self, url, **params):
+        seen, cursor = [], None
+        while True:
+            response = self.client.get(url, {'limit': 2, **params, **({'cursor': cursor} if cursor else {})})
+            self.assertEqual(response.status_code, 200)
+            seen += [r['id'] for r in response.data['results']]
+            cursor = response.data['next_cursor']
+            if cursor is None:
+                return seen
+
+    def test_inbox_pages(self):
+        self.authenticate(self.student)
+        newest_first = sorted(self.matches, key=lambda m: (m.last_activity_at, m.id), reverse=True)
+        self.assertEqual(self.pages('/api/inbox/'), [m.id for m in newest_first])
+
+    def test_verification_pages(self):
+        self.authenticate(self.staff)
+        newest_first = sorted(VerificationRequest.objects.all(), key=lambda r: (r.submitted_at, r.id), reverse=True)
+        self.assertEqual(self.pages('/api/verification/'), [r.id for r in newest_first])
+        self.requests[0].approve(reviewer=self.staff)
+        self.assertEqual(self.pages('/api/verification/', status='approved'), [self.requests[0].id])
+        self.assertEqual(len(self.pages('/api/verification/', status='all')), 5)
+
+    def test_bad_cursors_are_rejected(self):
+        for user, url in ((self.student, '/api/inbox/'), (self.staff, '/api/verification/')):
+            self.authenticate(user)
+            for cursor in self.BAD_CURSORS:
+                response = self.client.get(url, {'cursor': cursor})
+                self.assertEqual(response.status_code, 400, (url, cursor))
+
+
+class VerificationBulkTests(BearerClientMixin, APITestCase):
+    def setUp(self):
+        self.staff = User.objects.create_user('staff', password='pw', is_staff=True)
+        self.pros = [User.objects.create_user(f'pro{i}', password='pw', role='professional') for i in range(3)]
+        self.requests = [VerificationRequest.objects.create(user=pro) for pro in self.pros]
+        self.authenticate(self.staff)
+
+    def bulk(self, action, ids):
+        return self.client.post('/api/verification/bulk/', {'action': action, 'ids': ids}, format='json')
+
+    def test_approve(self):
+        # Cache the profile first: bulk updates send no signals
+        self.authenticate(self.pros[0])
+        self.assertFalse(self.client.get('/api/profile/').data['is_verified'])
+        self.authenticate(self.staff)
+        ids = [r.id for r in self.requests[:2]]
+        response = self.bulk('approve', ids + [0, 99999])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data, {'updated': 2, 'not_found': [0, 99999]})
+        for request in VerificationRequest.objects.filter(id__in=ids):
+            self.assertEqual((request.status, request.reviewer_id), ('approved', self.staff.id))
+            self.assertIsNotNone(request.reviewed_at)
+        self.assertEqual(set(User.objects.filter(is_verified=True).values_list('username', flat=True)), {'pro0', 'pro1'})
+        self.assertEqual(set(MatchScoreRefresh.objects.values_list('user_id', flat=True)), {self.pros[0].id, self.pros[1].id})
+        self.assertEqual(VerificationRequest.objects.get(id=self.requests[2].id).status, 'pending')
+        self.authenticate(self.pros[0])
+        self.assertTrue(self.client.get('/api/profile/').data['is_verified'])
+
+    def test_reject(self):
+        response = self.bulk('reject', [r.id for r in self.requests])
+        self.assertEqual(response.data, {'updated': 3, 'not_found': []})
+        self.assertEqual(set(VerificationRequest.objects.values_list('status', flat=True)), {'rejected'})
+        self.assertFalse(User.objects.filter(is_verified=True).exists())
+        self.assertFalse(MatchScoreRefresh.objects.exists())
+
+    def test_queries_do_not_grow_with_the_batch(self):
+        more = [
+            VerificationRequest.objects.create(user=User.objects.create_user(f'more{i}', password='pw', role='professional'))
+            for i in range(20)
+        ]
+        with CaptureQueriesContext(connection) as one:
+            self.bulk('approve', [self.requests[0].id])
+        with CaptureQueriesContext(connection) as many:
+            self.bulk('approve', [r.id for r in more])
+        self.assertEqual(len(many), len(one))
+
+    def test_rejects_bad_requests(self):
+        self.assertEqual(self.bulk('delete', [self.requests[0].id]).status_code, 400)
+        self.assertEqual(self.bulk('approve', []).status_code, 400)
+        self.authenticate(self.pros[0])
+        self.assertEqual(self.bulk('approve', [self.requests[0].id]).status_code, 403)
+        self.assertFalse(VerificationRequest.objects.exclude(status='pending').exists())
+
+
+@override_settings(DATABASE_REPLICAS=['replica1'], REPLICA_STICKY_SECONDS=1)
+class ReplicaRoutingTests(BearerClientMixin, APITestCase):
+    """Which alias reads are routed to; the queries themselves still run on the test database."""
+
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+        self.student = User.objects.create_user('student', password='pw', role='student')
+        self.professional = User.objects.create_user('professional', password='pw', role='professional')
+        self.match = Match.objects.create(user1=self.student, user2=self.professional)
+        self.authenticate(self.student)
+        self.routed = []
+        record = lambda router, model, **hints: self.routed.append(replicas._replica.get())
+        patcher = mock.patch.object(replicas.ReplicaRouter, 'db_for_read', autospec=True, side_effect=record)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def reads(self, method, url, data=None):
+        self.routed.clear()
+        response = getattr(self.client, method)(url, data, format='json')
+        self.assertLess(response.status_code, 300, url)
+        # The first read is the JWT user lookup, made before the view picks a replica
+        self.assertIsNone(self.routed[0])
+        return set(self.routed[1:])
+
+    def test_gets_of_replica_views_read_from_a_replica(self):
+        for url in ('/api/matches/', '/api/inbox/', f'/api/messages/{self.match.id}/'):
+            self.assertEqual(self.reads('get', url), {'replica1'}, url)
+        # Other views, and anything that is not a GET, stay on the primary
+        self.assertEqual(self.reads('get', '/api/profile/'), {None})
+        self.assertEqual(self.reads('post', f'/api/messages/{self.match.id}/read/'), {None})
+        self.assertIsNone(replicas._replica.get())
+
+    def test_writers_stick_to_the_primary_for_a_while(self):
+        self.assertEqual(self.reads('post', f'/api/messages/{self.match.id}/', {'match': self.match.id, 'content': 'hi'}),
+                         {None})
+        self.assertEqual(self.reads('get', f'/api/messages/{self.match.id}/'), {None})
+        # Only the writer is pinned
+        self.authenticate(self.professional)
+        self.assertEqual(self.reads('get', '/api/matches/'), {'replica1'})
+        self.authenticate(self.student)
+        time.sleep(1.1)
+        self.assertEqual(self.reads('get', '/api/matches/'), {'replica1'})
+
+    def test_writes_and_migrations_use_the_primary(self):
+        router = replicas.ReplicaRouter()
+        with replicas.reads_from('replica1'):
+            self.assertEqual(router.db_for_write(User), 'default')
+        self.assertFalse(router.allow_migrate('replica1', 'api'))
+        self.assertIsNone(router.allow_migrate('default', 'api'))
+
+
+class MessageHistoryTests(BearerClientMixin, APITestCase):
+    def setUp(self):
+        self.student = User.objects.create_user('student', password='pw', role='student')
+        professional = User.objects.create_user('professional', password='pw', role='professional')
+        self.match = Match.objects.create(user1=self.student, user2=professional)
+        now = timezone.now()
+        # Ids do not follow timestamps, and pairs share one
+        for i, minutes in enumerate([3, 3, 0, 5, 1, 1, 4]):
+            message = Message.objects.create(match=self.match, sender=self.student, content=f'm{i}')
+            Message.objects.filter(id=message.id).update(timestamp=now - timedelta(minutes=minutes))
+        self.history = list(Message.objects.order_by('timestamp', 'id').values_list('id', flat=True))
+        self.url = f'/api/messages/{self.match.id}/'
+        self.authenticate(self.student)
+
+    def page(self, **params):
+        response = self.client.get(self.url, params)
+        self.assertEqual(response.status_code, 200)
+        return [m['id'] for m in response.data['results']], response.data['next_cursor']
+
+    def test_full_history_without_paging(self):
+        self.assertEqual([m['id'] for m in self.client.get(self.url).data], self.history)
+
+    def test_pages_backwards_and_forwards(self):
+        seen, cursor = self.page(limit=3)
+        self.assertEqual(seen, self.history[-3:])
+        while cursor is not None:
+            older, cursor = self.page(limit=3, before=cursor)
+            seen = older + seen
+        self.assertEqual(seen, self.history)
+
+        seen, cursor = [self.history[0]], self.history[0]
+        while cursor is not None:
+            newer, cursor = self.page(limit=3, after=cursor)
+            seen += newer
+        self.assertEqual(seen, self.history)
+
+    def test_only_participants_see_messages(self):
+        self.authenticate(User.objects.create_user('stranger', password='pw', role='student'))
+        self.assertEqual(self.page(limit=3), ([], None))
+
+
+class MediaDeliveryTests(BearerClientMixin, APITestCase):
+    def setUp(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        override = self.settings(MEDIA_ROOT=media_root, MEDIA_SENDFILE='')
+        override.enable()
+        self.addCleanup(override.disable)
+        self.owner = User.objects.create_user('owner', password='pw', role='professional')
+        self.matched = User.objects.create_user('matched', password='pw', role='student')
+        self.stranger = User.objects.create_user('stranger', password='pw', role='student')
+        Match.objects.create(user1=self.matched, user2=self.owner)
+        self.authenticate(self.owner)
+
+    def upload(self, name, content, content_type):
+        response = self.client.post(f'/api/media/{self.owner.id}/', {
+            'file': SimpleUploadedFile(name, content, content_type=content_type),
+        }, format='multipart')
+        self.assertEqual(response.status_code, 201)
+        self.assertNotIn('file', response.data)
+        return response.data['id']
+
+    def test_only_owner_and_matches_can_fetch(self):
+        media_id = self.upload('clip.mp4', b'0123456789', 'video/mp4')
+        for user, expected in ((self.owner, 200), (self.matched, 200), (self.stranger, 404)):
+            self.authenticate(user)
+            self.assertEqual(self.client.get(f'/api/media/file/{media_id}/').status_code, expected, user.username)
+        self.client.credentials()
+        self.assertEqual(self.client.get(f'/api/media/file/{media_id}/').status_code, 401)
+
+    def test_signed_url_works_without_header(self):
+        self.upload('clip.mp4', b'0123456789', 'video/mp4')
+        url = self.client.get(f'/api/media/{self.owner.id}/').data[0]['url']
+        self.client.credentials()
+        self.assertEqual(self.client.get(url).status_code, 200)
+        self.assertEqual(self.client.get(url.replace('s=', 's=0')).status_code, 401)
+
+    def test_range_and_etag(self):
+        media_id = self.upload('clip.mp4', b'0123456789', 'video/mp4')
+        url = f'/api/media/file/{media_id}/'
+        response = self.client.get(url)
+        self.assertEqual(response['Content-Type'], 'video/mp4')
+        self.assertEqual(b''.join(response.streaming_content), b'0123456789')
+        etag = response['ETag']
+
+        response = self.client.get(url, HTTP_RANGE='bytes=2-5')
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response['Content-Range'], 'bytes 2-5/10')
+        self.assertEqual(b''.join(response.streaming_content), b'2345')
+        response = self.client.get(url, HTTP_RANGE='bytes=-3')
+        self.assertEqual(b''.join(response.streaming_content), b'789')
+        self.assertEqual(self.client.get(url, HTTP_RANGE='bytes=20-').status_code, 416)
+        self.assertEqual(self.client.get(url, HTTP_RANGE='bytes=2-5', HTTP_IF_RANGE='"stale"').status_code, 200)
+
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+    def test_content_type_is_not_taken_from_the_upload(self):
+        media_id = self.upload('x.html', b'<script>alert(1)</script>', 'image/png')
+        response = self.client.get(f'/api/media/file/{media_id}/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'application/octet-stream')
+        self.assertEqual(response['Content-Disposition'], 'attachment')
+        self.assertEqual(response['X-Content-Type-Options'], 'nosniff')
+
+        media_id = self.upload('photo.png', b'not really a png', 'image/png')
+        response = self.client.get(f'/api/media/file/{media_id}/')
+        self.assertEqual(response['Content-Type'], 'image/png')
+        self.assertFalse(response.get('Content-Disposition', '').startswith('attachment'))
+        self.assertEqual(response['X-Content-Type-Options'], 'nosniff')
+
+    def png(self, size):
+        out = io.BytesIO()
+        Image.new('RGB', size, 'teal').save(out, 'PNG')
+        return out.getvalue()
+
+    def test_identical_uploads_share_one_file(self):
+        content = self.png((40, 20))
+        first = self.upload('a.png', content, 'image/png')
+        self.authenticate(self.matched)
+        second = self.upload('b.png', content, 'image/png')
+        [name] = set(Media.objects.values_list('file', flat=True))
+        self.assertTrue(default_storage.exists(name))
+        with self.captureOnCommitCallbacks(execute=True):
+            Media.objects.get(id=first).delete()
+        self.assertTrue(default_storage.exists(name))
+        with self.captureOnCommitCallbacks(execute=True):
+            Media.objects.get(id=second).delete()
+        self.assertFalse(default_storage.exists(name))
+
+    def test_variants(self):
+        media_id = self.upload('photo.png', self.png((1600, 800)), 'image/png')
+        [listed] = self.client.get(f'/api/media/{self.owner.id}/').data
+        self.assertEqual((listed['processing_status'], listed['variants']), ('pending', {}))
+        self.assertEqual(self.client.get(f'/api/media/file/{media_id}/', {'variant': 'thumb'}).status_code, 404)
+
+        generate_variants(media_id)
+        [listed] = self.client.get(f'/api/media/{self.owner.id}/').data
+        self.assertEqual(listed['processing_status'], 'ready')
+        self.assertEqual(set(listed['variants']), {'thumb', 'preview'})
+        for variant, size in (('thumb', (256, 128)), ('preview', (1024, 512))):
+            response = self.client.get(listed['variants'][variant])
+            self.assertEqual(response['Content-Type'], 'image/jpeg')
+            with Image.open(io.BytesIO(b''.join(response.streaming_content))) as image:
+                self.assertEqual((image.format, image.size), ('JPEG', size))
+        self.assertEqual(self.client.get(f'/api/media/file/{media_id}/', {'variant': 'huge'}).status_code, 404)
+
+    def test_variants_only_for_readable_images(self):
+        video = self.upload('clip.mp4', b'0123456789', 'video/mp4')
+        broken = self.upload('broken.png', b'not really a png', 'image/png')
+        generate_variants(video)
+        with self.assertLogs('api.media', 'ERROR'):
+            generate_variants(broken)
+        self.assertEqual(Media.objects.get(id=video).processing_status, 'skipped')
+        self.assertEqual(Media.objects.get(id=broken).processing_status, 'failed')
+
+
+class ProfilingTests(BearerClientMixin, APITestCase):
+    def setUp(self):
+        self.profiles = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.profiles)
+        self.staff = User.objects.create_user('staff', password='pw', is_staff=True)
+        self.user = User.objects.create_user('user', password='pw', role='student', email='user@example.com')
+
+    def reports(self):
+        return [name for name in os.listdir(self.profiles) if name.endswith('.json')]
+
+    def test_staff_request_is_profiled(self):
+        self.authenticate(self.staff)
+        with self.settings(PROFILING_DIR=self.profiles):
+            response = self.client.get('/api/matches/?profile=1')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.reports(), [response['X-Profile-Id'] + '.json'])
+
+    def test_busy_profiler_never_fails_the_request(self):
+        self.authenticate(self.staff)
+        with self.settings(PROFILING_DIR=self.profiles):
+            with profiling._profiling:
+                response = self.client.get('/api/matches/?profile=1')
+            self.assertEqual(response.status_code, 200)
+            self.assertNotIn('X-Profile-Id', response)
+            error = ValueError('Another profiling tool is already active')
+            with mock.patch.object(profiling.cProfile.Profile, 'enable', side_effect=error):
+                response = self.client.get('/api/matches/?profile=1')
+            self.assertEqual(response.status_code, 200)
+            self.assertNotIn('X-Profile-Id', response)
+        self.assertEqual(self.reports(), [])
+
+    def test_sampled_reports_leave_out_parameters(self):
+        self.authenticate(self.user)
+        with self.settings(PROFILING_DIR=self.profiles, PROFILING_SAMPLE_RATE=1):
+            response = self.client.get('/api/inbox/?limit=5')
+        with open(os.path.join(self.profiles, response['X-Profile-Id'] + '.json')) as f:
+            report = json.load(f)
+        self.assertEqual(report['reason'], 'sampled')
+        self.assertEqual(report['path'], '/api/inbox/')
+        self.assertTrue(report['queries'])
+        self.assertEqual({q['params'] for q in report['queries']}, {'<redacted>'})
+
+
+@override_settings(METRICS_TOKEN='scrape-secret')
+class MetricsTests(BearerClientMixin, APITestCase):
+    def setUp(self):
+        registry.reset()
+        self.addCleanup(registry.reset)
+        self.user = User.objects.create_user('user', password='pw', role='student')
+        other = User.objects.create_user('other', password='pw', role='professional')
+        Match.objects.create(user1=self.user, user2=other)
+
+    def test_scrape_with_static_token(self):
+        self.client.credentials(HTTP_AUTHORIZATION='Bearer scrape-secret')
+        response = self.client.get('/api/metrics/')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('mentormatch_http_requests_total', response.content.decode())
+        for header in ('Bearer wrong-secret', 'Bearer scrape-secre', ''):
+            self.client.credentials(HTTP_AUTHORIZATION=header)
+            self.assertIn(self.client.get('/api/metrics/').status_code, (401, 403), header)
+
+    def test_staff_only_with_jwt(self):
+        self.authenticate(self.user)
+        self.assertEqual(self.client.get('/api/metrics/').status_code, 403)
+        self.authenticate(User.objects.create_user('staff', password='pw', is_staff=True))
+        self.assertEqual(self.client.get('/api/metrics/').status_code, 200)
+
+    def test_serializer_time_without_patching_drf(self):
+        from rest_framework import serializers
+        self.assertEqual(serializers.BaseSerializer.data.fget.__module__, 'rest_framework.serializers')
+        self.authenticate(self.user)
+        self.assertEqual(self.client.get('/api/matches/').status_code, 200)
+        self.client.credentials(HTTP_AUTHORIZATION='Bearer scrape-secret')
+        text = self.client.get('/api/metrics/').content.decode()
+        line = next(l for l in text.splitlines()
+                    if l.startswith('mentormatch_serializer_duration_seconds_sum{view="matches"'))
+        self.assertGreater(float(line.split()[-1]), 0)
+
+
+def delete_elsewhere(model, name):
+    """Delete a row behind this process's back, as another worker would."""
+    with connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {model._meta.db_table} WHERE name = %s', [name])
+
+
+class ProfileCacheTests(BearerClientMixin, APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+        self.owner = User.objects.create_user('owner', password='pw', role='professional', phone='555-0100')
+        self.viewer = User.objects.create_user('viewer', password='pw', role='student')
+        self.skill = Skill.objects.create(name='python')
+        self.owner.skills_offered.add(self.skill)
+
+    def profile(self, viewer):
+        self.authenticate(viewer)
+        response = self.client.get('/api/profile/' if viewer == self.owner else f'/api/users/{self.owner.id}/')
+        self.assertEqual(response.status_code, 200)
+        return response.data
+
+    def test_cached_per_visibility_class(self):
+        self.assertEqual(self.profile(self.owner)['phone'], '555-0100')
+        self.assertNotIn('phone', self.profile(self.viewer))
+        # Warm now: only the JWT user lookup is left
+        with self.assertNumQueries(1):
+            self.assertNotIn('phone', self.profile(self.viewer))
+        with self.assertNumQueries(1):
+            self.assertEqual(self.profile(self.owner)['phone'], '555-0100')
+
+    def test_changes_drop_cached_profiles(self):
+        skills = lambda data: [s['name'] for s in data['skills_offered']]
+        self.profile(self.viewer)
+        self.owner.show_phone = True
+        self.owner.save()
+        self.assertEqual(self.profile(self.viewer)['phone'], '555-0100')
+
+        self.owner.skills_offered.add(Skill.objects.create(name='go'))
+        self.assertEqual(sorted(skills(self.profile(self.viewer))), ['go', 'python'])
+        self.skill.name = 'Python 3'
+        self.skill.save()
+        self.assertEqual(sorted(skills(self.profile(self.viewer))), ['Python 3', 'go'])
+        self.skill.delete()
+        self.assertEqual(skills(self.profile(self.viewer)), ['go'])
+
+
+class HotQueryIndexTests(TestCase):
+    def test_hot_queries_use_indexes(self):
+        out = io.StringIO()
+        call_command('explain_hot_queries', stdout=out)
+        self.assertNotIn('FULL SCAN', out.getvalue())
+
+    def test_full_scan_detection(self):
+        from .management.commands.explain_hot_queries import FULL_SCAN
+        for line in ('SCAN api_user', '->  Seq Scan on api_user  (cost=0.00..1.01 rows=1 width=8)'):
+            self.assertTrue(FULL_SCAN.search(line), line)
+        for line in ('SEARCH api_user USING INDEX api_user_role_location (role=? AND country=?)',
+                     'SCAN api_message USING INDEX api_message_history', 'SCAN CONSTANT ROW'):
+            self.assertFalse(FULL_SCAN.search(line), line)
+
+
+class PurgeTests(TestCase):
+    def setUp(self):
+        now = timezone.now()
+        self.due = User.objects.create_user('due', password='pw', role='student',
+                                            deletion_scheduled_at=now - timedelta(days=8))
+        self.waiting = User.objects.create_user('waiting', password='pw', role='student',
+                                                deletion_scheduled_at=now - timedelta(days=6))
+        self.other = User.objects.create_user('other', password='pw', role='professional')
+        match = Match.objects.create(user1=self.due, user2=self.other)
+        for i in range(5):
+            Message.objects.create(match=match, sender=(self.due, self.other)[i % 2], content=f'm{i}')
+        Swipe.objects.create(from_user=self.due, to_user=self.other, liked=True)
+        Swipe.objects.create(from_user=self.other, to_user=self.due, liked=True)
+        Swipe.objects.create(from_user=self.other, to_user=self.waiting, liked=False)
+        MatchScore.objects.create(user=self.other, candidate=self.due, score=50)
+        VerificationRequest.objects.create(user=self.other)
+
+    def assertPurged(self):
+        self.assertEqual(set(User.objects.values_list('username', flat=True)), {'waiting', 'other'})
+        self.assertFalse(Match.objects.exists())
+        self.assertFalse(Message.objects.exists())
+        self.assertFalse(MatchScore.objects.exists())
+        self.assertEqual(list(Swipe.objects.values_list('to_user__username', flat=True)), ['waiting'])
+        self.assertEqual(VerificationRequest.objects.count(), 1)
+
+    def test_purges_only_accounts_past_the_grace_period(self):
+        self.assertEqual(purge_due_accounts(batch_size=2), 1)
+        self.assertPurged()
+        self.assertEqual(purge_due_accounts(batch_size=2), 0)
+
+    def test_interrupted_purge_resumes(self):
+        # Stop after the second batch of messages
+        with mock.patch('api.purge.time.sleep', side_effect=[None, KeyboardInterrupt]):
+            with self.assertRaises(KeyboardInterrupt):
+                purge_due_accounts(batch_size=2, pause=1)
+        self.assertEqual(Message.objects.count(), 1)
+        self.assertTrue(User.objects.filter(id=self.due.id).exists())
+        self.assertEqual(purge_due_accounts(batch_size=2), 1)
+        self.assertPurged()
+
+
+class CandidateExclusionTests(TestCase):
+    def test_swiped_and_matched_users_are_excluded(self):
+        student = User.objects.create_user('student', password='pw', role='student')
+        pros = {name: User.objects.create_user(name, password='pw', role='professional', is_verified=True)
+                for name in ('liked', 'disliked', 'matched', 'matched_reversed', 'liked_me', 'fresh')}
+        User.objects.create_user('unverified', password='pw', role='professional')
+        Swipe.objects.create(from_user=student, to_user=pros['liked'], liked=True)
+        Swipe.objects.create(from_user=student, to_user=pros['disliked'], liked=False)
+        Match.objects.create(user1=student, user2=pros['matched'])
+        Match.objects.create(user1=pros['matched_reversed'], user2=student)
+        Swipe.objects.create(from_user=pros['liked_me'], to_user=student, liked=True)
+        names = set(candidate_queryset(student, local=False).values_list('username', flat=True))
+        self.assertEqual(names, {'liked_me', 'fresh'})
+
+
+class VocabularyTests(TestCase):
+    def setUp(self):
+        vocabulary.clear()
+        self.addCleanup(vocabulary.clear)
+        self.user = User.objects.create_user('user', password='pw', role='student')
+
+    def test_rolled_back_ids_are_not_cached(self):
+        with self.assertRaises(RuntimeError), transaction.atomic():
+            vocabulary.resolve(Skill, ['Rust'])
+            raise RuntimeError
+        self.assertFalse(Skill.objects.exists())
+        with self.captureOnCommitCallbacks(execute=True):
+            [skill_id] = vocabulary.resolve(Skill, ['Rust'])
+        self.assertEqual(Skill.objects.get(name='Rust').id, skill_id)
+        with self.assertNumQueries(0):
+            self.assertEqual(vocabulary.resolve(Skill, ['Rust']), [skill_id])
+
+    def test_stale_id_is_replaced_inside_a_transaction(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            vocabulary.resolve(Skill, ['Go'])
+        delete_elsewhere(Skill, 'Go')
+        vocabulary.assign(self.user.skills_offered, Skill, ['Go'])
+        self.assertEqual(list(self.user.skills_offered.values_list('name', flat=True)), ['Go'])
+
+
+class VocabularyCommitTests(TransactionTestCase):
+    def tearDown(self):
+        vocabulary.clear()
+
+    def test_stale_id_is_retried_at_commit(self):
+        user = User.objects.create_user('user', password='pw', role='student')
+        vocabulary.resolve(Hobby, ['Chess'])
+        delete_elsewhere(Hobby, 'Chess')
+        vocabulary.assign(user.hobbies, Hobby, ['Chess'])
+        self.assertEqual(list(user.hobbies.values_list('name', flat=True)), ['Chess'])
@@ -11,13 +11,23 @@ urlpatterns = [
     path('profile/update/', views.ProfileUpdateView.as_view(), name='profile-update'),
 
     path('swipe/', views.SwipeView.as_view(), name='swipe'),
+    path('swipe/batch/', views.SwipeBatchView.as_view(), name='swipe-batch'),
     path('matches/', views.MatchListView.as_view(), name='matches'),
     path('potential/', views.PotentialMatchesView.as_view(), name='potential'),
 
     path('messages/<int:match_id>/', views.MessageListCreateView.as_view(), name='messages'),
+    path('messages/<int:match_id>/stream/', views.message_stream, name='message-stream'),
+    path('messages/<int:match_id>/read/', views.MessageReadView.as_view(), name='messages-read'),
+    path('inbox/', views.InboxView.as_view(), name='inbox'),
     path('verification/', views.VerificationRequestListView.as_view(), name='verification-list'),
+    path('verification/bulk/', views.VerificationRequestBulkView.as_view(), name='verification-bulk'),
     path('verification/<int:req_id>/', views.VerificationRequestUpdateView.as_view(), name='verification-update'),
     path('users/<int:id>/', views.UserDetailView.as_view(), name='user-detail'),
     path('media/<int:user_id>/', views.MediaListCreateView.as_view(), name='media-list-create'),
+    path('media/file/<int:media_id>/', views.MediaFileView.as_view(), name='media-file'),
     path('account/deletion/', views.AccountDeletionScheduleView.as_view(), name='account-deletion'),
+    path('metrics/', views.MetricsView.as_view(), name='metrics'),
+    path('profiling/', views.ProfilingReportListView.as_view(), name='profiling-list'),
+    path('profiling/<str:report_id>/', views.ProfilingReportView.as_view(), name='profiling-report'),
+    path('profiling/<str:report_id>/pstats/', views.ProfilingReportView.as_view(), {'pstats': True}, name='profiling-pstats'),
 ]
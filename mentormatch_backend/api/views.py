@@ -1,10 +1,28 @@
 from rest_framework import generics, permissions, status
 from rest_framework.response import Response
-from .serializers import RegisterSerializer, UserSerializer, ProfileUpdateSerializer, SwipeSerializer, MatchSerializer, MessageSerializer, MediaSerializer
-from .models import User, Swipe, Match, Message, Media
+from .serializers import RegisterSerializer, UserSerializer, ProfileUpdateSerializer, SwipeSerializer, SwipeBatchItemSerializer, SwipeBatchSerializer, MatchSerializer, MessageSerializer, MediaSerializer, InboxSerializer, user_prefetch
+from .models import User, Match, Message, Media
 from rest_framework.views import APIView
-from django.db.models import Q
+from rest_framework.exceptions import AuthenticationFailed, NotAuthenticated, ValidationError
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from asgiref.sync import sync_to_async
+from django.db import transaction
+from django.http import FileResponse, HttpResponse, JsonResponse
+from django.db.models import BigIntegerField, Case, Count, F, Max, OuterRef, Q, Subquery, Value, When, prefetch_related_objects
+from django.db.models.functions import Coalesce
 from django.utils import timezone
+from datetime import datetime, timedelta, timezone as dt_timezone
+import math
+from .matching import candidate_queryset, stored_matches, top_candidates
+from .media import can_view_media, signed_viewer, variant_names
+from .media_delivery import serve_file
+from .metrics import CanReadMetrics, MetricsTokenAuthentication, registry as metrics_registry
+from .profiling import list_reports, report_path
+from .profile_cache import get_profile
+from .purge import grace_period
+from .realtime import get_broker, match_channel
+from .replicas import ReplicaReadMixin, stick_to_primary
+from .swipes import record_swipes
 
 class RegisterView(generics.CreateAPIView):
     queryset = User.objects.all()
@@ -18,6 +36,9 @@ class ProfileView(generics.RetrieveAPIView):
     def get_object(self):
         return self.request.user
 
+    def retrieve(self, request, *args, **kwargs):
+        return Response(get_profile(request.user.id, request, self.get_object))
+
 class ProfileUpdateView(generics.UpdateAPIView):
     permission_classes = (permissions.IsAuthenticated,)
     serializer_class = ProfileUpdateSerializer
@@ -25,61 +46,127 @@ class ProfileUpdateView(generics.UpdateAPIView):
     def get_object(self):
         return self.request.user
 
-class PotentialMatchesView(APIView):
+
+MAX_PAGE_SIZE = 100
+
+# Timestamp cursors ("micros:id", inbox and verification queue) encode the
+# timestamp as microseconds since this epoch
+CURSOR_EPOCH = datetime(1970, 1, 1, tzinfo=dt_timezone.utc)
+
+
+def _cursor_id(value):
+    """Parse one integer part of a cursor; raises ValueError unless it fits a
+    database id (0 <= id < 2**63), so a huge value answers 400, not 500."""
+    number = int(value)
+    if not 0 <= number < 2 ** 63:
+        raise ValueError(f'Cursor value out of range: {value}')
+    return number
+
+
+def _time_cursor(ts, obj_id):
+    return f'{(ts - CURSOR_EPOCH) // timedelta(microseconds=1)}:{obj_id}'
+
+
+def _parse_time_cursor(cursor):
+    """(timestamp, id) from a cursor made by _time_cursor; raises ValueError."""
+    micros, obj_id = cursor.split(':')
+    try:
+        ts = CURSOR_EPOCH + timedelta(microseconds=int(micros))
+    except (OverflowError, OSError) as exc:
+        # Out-of-range timestamps; report them like any other bad cursor
+        raise ValueError(f'Invalid cursor: {exc}') from exc
+    return ts, _cursor_id(obj_id)
+
+
+def _page_params(request):
+    """Parse the optional `limit` and `cursor` ("score:id") query params."""
+    limit = request.query_params.get('limit')
+    cursor = request.query_params.get('cursor')
+    if limit is not None:
+        limit = int(limit)
+        if limit < 1:
+            raise ValueError('limit must be positive')
+        limit = min(limit, MAX_PAGE_SIZE)
+    if cursor:
+        score, cid = cursor.split(':')
+        cursor = (_cursor_id(score), _cursor_id(cid))
+    else:
+        cursor = None
+    return limit, cursor
+
+
+class PotentialMatchesView(ReplicaReadMixin, APIView):
     permission_classes = (permissions.IsAuthenticated,)
+    # A page running past the stored scores also scores the rest live
+    query_budget = 11
 
     def get(self, request):
         user = request.user
-        opposite_role = 'professional' if user.role == 'student' else 'student'
-        candidates = User.objects.filter(role=opposite_role).exclude(id=user.id)
-        if user.role == 'student':
-            candidates = candidates.filter(is_verified=True)
-        global_flag = request.query_params.get('global') == '1'
-        if not global_flag and user.city and user.country:
-            candidates = candidates.filter(country=user.country)
-            if user.state:
-                candidates = candidates.filter(state=user.state)
-        offered_filter = request.query_params.get('offered')
-        needed_filter = request.query_params.get('needed')
-        if offered_filter:
-            candidates = candidates.filter(skills_offered__name__iexact=offered_filter)
-        if needed_filter:
-            candidates = candidates.filter(skills_needed__name__iexact=needed_filter)
+        local = request.query_params.get('global') != '1' and bool(user.city and user.country)
+        candidates = candidate_queryset(
+            user,
+            local=local,
+            offered=request.query_params.get('offered'),
+            needed=request.query_params.get('needed'),
+        )
+        try:
+            limit, after = _page_params(request)
+        except ValueError:
+            return Response({'detail': 'Invalid limit or cursor.'}, status=status.HTTP_400_BAD_REQUEST)
+        # Fetch one extra row to know whether there is a next page
+        fetch = limit + 1 if limit else None
+        if local:
+            # Same-country scores are precomputed and already ranked
+            ranked = stored_matches(user, candidates, after, fetch)
+        else:
+            ranked = top_candidates(user, candidates, after, fetch)
+        page = ranked[:limit]
+        prefetch_related_objects([c for c, _ in page], *user_prefetch())
         results = []
-        user_offered = set(s.lower() for s in user.skills_offered.values_list('name', flat=True))
-        user_needed = set(s.lower() for s in user.skills_needed.values_list('name', flat=True))
-
-        for c in candidates:
-            cs_offered = set(s.lower() for s in c.skills_offered.values_list('name', flat=True))
-            cs_needed = set(s.lower() for s in c.skills_needed.values_list('name', flat=True))
-            cross_teach_overlap = len(user_needed & cs_offered) + len(user_offered & cs_needed)
-            offered_synergy = len(user_offered & cs_offered)
-            needed_synergy = len(user_needed & cs_needed)
-
-            teach_union = len(user_needed | cs_offered) or 1
-            learn_union = len(user_offered | cs_needed) or 1
-            teach_jaccard = cross_teach_overlap / teach_union
-            learn_jaccard = cross_teach_overlap / learn_union
-            synergy_score = (offered_synergy + needed_synergy) / ((len(user_offered)+len(user_needed)) or 1)
-            score = teach_jaccard * 0.7 + learn_jaccard * 0.2 + synergy_score * 0.1
-            if c.is_verified and user.role == 'student':
-                score += 0.1
-            score = min(100, round(score * 100))
+        for c, score in page:
             results.append({'user': UserSerializer(c).data, 'score': score})
-        results.sort(key=lambda x: x['score'], reverse=True)
-        return Response(results)
+        if limit is None:
+            return Response(results)
+        next_cursor = None
+        if len(ranked) > limit:
+            last_user, last_score = ranked[limit - 1]
+            next_cursor = f'{last_score}:{last_user.id}'
+        return Response({'results': results, 'next_cursor': next_cursor})
 
 
 class VerificationRequestListView(APIView):
+    """The review queue, newest first: ?status=pending (default), approved,
+    rejected or all; ?limit=N with ?cursor=<next_cursor> pages through it."""
     permission_classes = (permissions.IsAuthenticated,)
+    query_budget = 2
 
     def get(self, request):
         if not request.user.is_staff:
             return Response({'detail': 'Not authorized'}, status=status.HTTP_403_FORBIDDEN)
-        from .models import VerificationRequest
-        qs = VerificationRequest.objects.order_by('-submitted_at')
+        from .models import VERIFICATION_STATUS, VerificationRequest
+        status_filter = request.query_params.get('status', 'pending')
+        if status_filter != 'all' and status_filter not in dict(VERIFICATION_STATUS):
+            return Response({'detail': 'Invalid status.'}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            limit = min(max(int(request.query_params.get('limit', 50)), 1), MAX_PAGE_SIZE)
+            cursor = request.query_params.get('cursor')
+            if cursor:
+                ts, cursor_id = _parse_time_cursor(cursor)
+        except ValueError:
+            return Response({'detail': 'Invalid limit or cursor.'}, status=status.HTTP_400_BAD_REQUEST)
+        qs = VerificationRequest.objects.select_related('user', 'reviewer').order_by('-submitted_at', '-id')
+        if status_filter != 'all':
+            qs = qs.filter(status=status_filter)
+        if cursor:
+            qs = qs.filter(Q(submitted_at__lt=ts) | Q(submitted_at=ts, id__lt=cursor_id))
+        page = list(qs[:limit + 1])
+        next_cursor = None
+        if len(page) > limit:
+            last = page[limit - 1]
+            next_cursor = _time_cursor(last.submitted_at, last.id)
         from .serializers import VerificationRequestSerializer
-        return Response(VerificationRequestSerializer(qs, many=True).data)
+        data = VerificationRequestSerializer(page[:limit], many=True, context={'request': request}).data
+        return Response({'results': data, 'next_cursor': next_cursor})
 
 
 class VerificationRequestUpdateView(APIView):
@@ -103,49 +190,90 @@ class VerificationRequestUpdateView(APIView):
         from .serializers import VerificationRequestSerializer
         return Response(VerificationRequestSerializer(req).data)
 
+
+class VerificationRequestBulkView(APIView):
+    """Approve or reject many requests at once: {"action": ..., "ids": [...]}."""
+    permission_classes = (permissions.IsAuthenticated,)
+
+    def post(self, request):
+        if not request.user.is_staff:
+            return Response({'detail': 'Not authorized'}, status=status.HTTP_403_FORBIDDEN)
+        from .models import VerificationRequest
+        from .serializers import VerificationBulkSerializer
+        serializer = VerificationBulkSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        ids = set(serializer.validated_data['ids'])
+        found = set(VerificationRequest.objects.filter(id__in=ids).values_list('id', flat=True))
+        selected = VerificationRequest.objects.filter(id__in=found)
+        if serializer.validated_data['action'] == 'approve':
+            updated = selected.approve(reviewer=request.user)
+        else:
+            updated = selected.reject(reviewer=request.user)
+        return Response({'updated': updated, 'not_found': sorted(ids - found)})
+
 class SwipeView(generics.CreateAPIView):
     permission_classes = (permissions.IsAuthenticated,)
     serializer_class = SwipeSerializer
+    # A like that completes a match also inserts it and reads it back
+    query_budget = 10
 
     def create(self, request, *args, **kwargs):
-        from_user = request.user
-        to_user_id = request.data.get('to_user')
-        liked = request.data.get('liked', False)
-        try:
-            to_user = User.objects.get(id=to_user_id)
-        except User.DoesNotExist:
+        # Same parsing as batch items, so form-encoded "false" is a dislike
+        item = SwipeBatchItemSerializer(data=request.data)
+        if not item.is_valid():
+            if 'to_user' in item.errors:
+                return Response({'detail': 'User not found'}, status=status.HTTP_404_NOT_FOUND)
+            raise ValidationError(item.errors)
+        matches, unknown = record_swipes(request.user, [(item.validated_data['to_user'], item.validated_data['liked'])])
+        stick_to_primary(request.user.id)
+        if unknown:
             return Response({'detail': 'User not found'}, status=status.HTTP_404_NOT_FOUND)
-        swipe, created = Swipe.objects.update_or_create(from_user=from_user, to_user=to_user, defaults={'liked': liked})
-        if liked:
-            reciprocal = Swipe.objects.filter(from_user=to_user, to_user=from_user, liked=True).first()
-            if reciprocal:
-                u1, u2 = (from_user, to_user) if from_user.id < to_user.id else (to_user, from_user)
-                match, m_created = Match.objects.get_or_create(user1=u1, user2=u2)
-                return Response({'matched': True, 'match': MatchSerializer(match).data})
+        if matches:
+            return Response({'matched': True, 'match': MatchSerializer(matches[0]).data})
         return Response({'matched': False})
 
-class MatchListView(generics.ListAPIView):
+class SwipeBatchView(APIView):
+    permission_classes = (permissions.IsAuthenticated,)
+    query_budget = 10
+
+    def post(self, request):
+        serializer = SwipeBatchSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        swipes = [(s['to_user'], s['liked']) for s in serializer.validated_data['swipes']]
+        matches, unknown = record_swipes(request.user, swipes)
+        stick_to_primary(request.user.id)
+        return Response({'matches': MatchSerializer(matches, many=True).data, 'not_found': unknown})
+
+class MatchListView(ReplicaReadMixin, generics.ListAPIView):
     permission_classes = (permissions.IsAuthenticated,)
     serializer_class = MatchSerializer
+    query_budget = 2
 
     def get_queryset(self):
         user = self.request.user
-        return Match.objects.filter(Q(user1=user) | Q(user2=user)).order_by('-timestamp')
+        return (
+            Match.objects.filter(Q(user1=user) | Q(user2=user))
+            .select_related('user1', 'user2')
+            .order_by('-timestamp')
+        )
 
-class MessageListCreateView(generics.ListCreateAPIView):
+class MessageListCreateView(ReplicaReadMixin, generics.ListCreateAPIView):
     permission_classes = (permissions.IsAuthenticated,)
     serializer_class = MessageSerializer
+    # POST also updates the conversation's inbox fields (_touch_conversation)
+    query_budgets = {'GET': 3, 'POST': 4}
 
     def get_queryset(self):
         from django.utils.dateparse import parse_datetime
         match_id = self.kwargs['match_id']
         # Only allow access if the requesting user is part of the match
-        is_participant = Match.objects.filter(
-            Q(id=match_id) & (Q(user1=self.request.user) | Q(user2=self.request.user))
-        ).exists()
-        if not is_participant:
+        if not _is_participant(self.request.user, match_id):
             return Message.objects.none()
-        qs = Message.objects.filter(match_id=match_id).order_by('timestamp')
+        qs = (
+            Message.objects.filter(match_id=match_id)
+            .select_related('sender')
+            .order_by('timestamp', 'id')
+        )
         # Optional incremental fetch: /api/messages/<id>/?since=ISO_DATETIME
         since = self.request.query_params.get('since')
         if since:
@@ -154,9 +282,172 @@ class MessageListCreateView(generics.ListCreateAPIView):
                 qs = qs.filter(timestamp__gt=dt)
         return qs
 
+    def list(self, request, *args, **kwargs):
+        # Keyset pages: ?limit=N loads the newest page, ?before=<id> older
+        # ones and ?after=<id> newer ones. Without them, the full history.
+        params = request.query_params
+        if not any(k in params for k in ('limit', 'before', 'after')):
+            return super().list(request, *args, **kwargs)
+        try:
+            limit = min(max(int(params.get('limit', 50)), 1), MAX_PAGE_SIZE)
+            before = _cursor_id(params['before']) if params.get('before') else None
+            after = _cursor_id(params['after']) if params.get('after') else None
+        except ValueError:
+            return Response({'detail': 'Invalid limit, before or after.'}, status=status.HTTP_400_BAD_REQUEST)
+        qs = self.get_queryset()
+        if after is not None:
+            qs = _message_keyset(qs, after, older=False).order_by('timestamp', 'id')
+        else:
+            if before is not None:
+                qs = _message_keyset(qs, before, older=True)
+            qs = qs.order_by('-timestamp', '-id')
+        page = list(qs[:limit + 1])
+        more = len(page) > limit
+        page = page[:limit]
+        if after is None:
+            page.reverse()
+        next_cursor = None
+        if more:
+            next_cursor = page[-1].id if after is not None else page[0].id
+        return Response({'results': self.get_serializer(page, many=True).data, 'next_cursor': next_cursor})
+
     def perform_create(self, serializer):
         # Sender is always the authenticated user
-        serializer.save(sender=self.request.user)
+        message = serializer.save(sender=self.request.user)
+        _touch_conversation(message)
+        stick_to_primary(self.request.user.id)
+        # Wake clients long-polling this conversation (see message_stream)
+        transaction.on_commit(lambda: get_broker().publish(match_channel(message.match_id), message.id))
+
+
+def _touch_conversation(message):
+    """Update the match's inbox fields; the sender has read up to their own message."""
+    Match.objects.filter(id=message.match_id).update(
+        last_activity_at=message.timestamp,
+        last_message_at=message.timestamp,
+        last_message_preview=message.content[:120],
+        user1_read_id=Case(When(user1_id=message.sender_id, then=Value(message.id)), default=F('user1_read_id'),
+                          output_field=BigIntegerField()),
+        user2_read_id=Case(When(user2_id=message.sender_id, then=Value(message.id)), default=F('user2_read_id'),
+                          output_field=BigIntegerField()),
+    )
+
+
+def _message_keyset(qs, cursor_id, older):
+    """Messages strictly before/after message `cursor_id` in (timestamp, id) order."""
+    ts = Subquery(Message.objects.filter(id=cursor_id).values('timestamp')[:1])
+    if older:
+        return qs.filter(Q(timestamp__lt=ts) | Q(timestamp=ts, id__lt=cursor_id))
+    return qs.filter(Q(timestamp__gt=ts) | Q(timestamp=ts, id__gt=cursor_id))
+
+
+def _is_participant(user, match_id):
+    return Match.objects.filter(Q(id=match_id) & (Q(user1=user) | Q(user2=user))).exists()
+
+
+def _jwt_user(request):
+    try:
+        result = JWTAuthentication().authenticate(request)
+    except AuthenticationFailed:
+        return None
+    return result[0] if result else None
+
+
+def _messages_after(match_id, after_id):
+    qs = Message.objects.filter(match_id=match_id, id__gt=after_id).select_related('sender').order_by('id')
+    return MessageSerializer(qs, many=True).data
+
+
+STREAM_MAX_TIMEOUT = 55
+
+
+async def message_stream(request, match_id):
+    """Long-poll for messages of a match newer than ?after=<message id>.
+
+    Answers at once if there are any, otherwise waits up to ?timeout=
+    seconds (default 25) for the next one. Run under the ASGI application
+    (mentormatch_backend/asgi.py) so waiting clients do not hold a worker.
+    """
+    if request.method != 'GET':
+        return JsonResponse({'detail': f'Method "{request.method}" not allowed.'}, status=405)
+    user = await sync_to_async(_jwt_user)(request)
+    if user is None:
+        return JsonResponse({'detail': 'Authentication credentials were not provided.'}, status=401)
+    if not await sync_to_async(_is_participant)(user, match_id):
+        return JsonResponse({'detail': 'Not found'}, status=404)
+    try:
+        after = _cursor_id(request.GET.get('after', 0))
+        timeout = float(request.GET.get('timeout', 25))
+        if not math.isfinite(timeout):
+            raise ValueError(timeout)
+    except ValueError:
+        return JsonResponse({'detail': 'Invalid after or timeout.'}, status=400)
+    timeout = min(max(timeout, 0), STREAM_MAX_TIMEOUT)
+    # Subscribe before reading so a message saved in between still wakes us
+    subscription = get_broker().subscribe(match_channel(match_id))
+    try:
+        messages = await sync_to_async(_messages_after)(match_id, after)
+        if not messages and await subscription.wait(timeout) is not None:
+            messages = await sync_to_async(_messages_after)(match_id, after)
+    finally:
+        subscription.close()
+    return JsonResponse(messages, safe=False)
+
+
+class InboxView(ReplicaReadMixin, APIView):
+    permission_classes = (permissions.IsAuthenticated,)
+    query_budget = 2
+
+    def get(self, request):
+        user = request.user
+        try:
+            limit = min(max(int(request.query_params.get('limit', 20)), 1), MAX_PAGE_SIZE)
+            cursor = request.query_params.get('cursor')
+            if cursor:
+                ts, cursor_id = _parse_time_cursor(cursor)
+        except ValueError:
+            return Response({'detail': 'Invalid limit or cursor.'}, status=status.HTTP_400_BAD_REQUEST)
+        read_id = Case(When(user1=user, then=F('user1_read_id')), default=F('user2_read_id'))
+        unread = (
+            Message.objects.filter(match=OuterRef('pk'), id__gt=OuterRef('my_read_id'))
+            .exclude(sender=user)
+            .order_by()
+            .values('match')
+            .annotate(n=Count('id'))
+            .values('n')
+        )
+        qs = (
+            Match.objects.filter(Q(user1=user) | Q(user2=user))
+            .select_related('user1', 'user2')
+            .annotate(my_read_id=read_id)
+            .annotate(unread_count=Coalesce(Subquery(unread), 0))
+            .order_by('-last_activity_at', '-id')
+        )
+        if cursor:
+            qs = qs.filter(Q(last_activity_at__lt=ts) | Q(last_activity_at=ts, id__lt=cursor_id))
+        page = list(qs[:limit + 1])
+        next_cursor = None
+        if len(page) > limit:
+            last = page[limit - 1]
+            next_cursor = _time_cursor(last.last_activity_at, last.id)
+        data = InboxSerializer(page[:limit], many=True, context={'request': request}).data
+        return Response({'results': data, 'next_cursor': next_cursor})
+
+
+class MessageReadView(APIView):
+    permission_classes = (permissions.IsAuthenticated,)
+    query_budget = 4
+
+    def post(self, request, match_id):
+        user = request.user
+        match = Match.objects.filter(Q(id=match_id) & (Q(user1=user) | Q(user2=user))).first()
+        if match is None:
+            return Response({'detail': 'Not found'}, status=status.HTTP_404_NOT_FOUND)
+        last_id = Message.objects.filter(match_id=match_id).aggregate(last=Max('id'))['last'] or 0
+        field = 'user1_read_id' if match.user1_id == user.id else 'user2_read_id'
+        Match.objects.filter(id=match.id).update(**{field: last_id})
+        stick_to_primary(user.id)
+        return Response({'read_id': last_id})
 
 
 class UserDetailView(generics.RetrieveAPIView):
@@ -165,6 +456,9 @@ class UserDetailView(generics.RetrieveAPIView):
     queryset = User.objects.all()
     lookup_field = 'id'
 
+    def retrieve(self, request, *args, **kwargs):
+        return Response(get_profile(self.kwargs['id'], request, self.get_object))
+
 
 class MediaListCreateView(generics.ListCreateAPIView):
     permission_classes = (permissions.IsAuthenticated,)
@@ -172,12 +466,7 @@ class MediaListCreateView(generics.ListCreateAPIView):
 
     def get_queryset(self):
         user_id = self.kwargs['user_id']
-        if str(self.request.user.id) == str(user_id):
-            return Media.objects.filter(user_id=user_id).order_by('-uploaded_at')
-        matched = Match.objects.filter(
-            (Q(user1_id=self.request.user.id, user2_id=user_id) | Q(user2_id=self.request.user.id, user1_id=user_id))
-        ).exists()
-        if matched:
+        if can_view_media(self.request.user.id, user_id):
             return Media.objects.filter(user_id=user_id).order_by('-uploaded_at')
         return Media.objects.none()
 
@@ -185,6 +474,35 @@ class MediaListCreateView(generics.ListCreateAPIView):
         serializer.save(user=self.request.user)
 
 
+class MediaFileView(APIView):
+    # Authenticated by bearer token or by the signed URL from MediaSerializer
+    permission_classes = (permissions.AllowAny,)
+    query_budget = 3
+
+    def perform_content_negotiation(self, request, force=False):
+        # Browsers ask for image/* or video/*; errors still render as JSON
+        return super().perform_content_negotiation(request, force=True)
+
+    def get(self, request, media_id):
+        if 's' in request.query_params:
+            viewer_id = signed_viewer(media_id, request.query_params)
+        else:
+            viewer_id = request.user.id if request.user.is_authenticated else None
+        if viewer_id is None:
+            raise NotAuthenticated()
+        media = Media.objects.filter(id=media_id).only('user_id', 'file', 'media_type', 'content_hash', 'processing_status').first()
+        if media is None or not can_view_media(viewer_id, media.user_id):
+            return Response({'detail': 'Not found'}, status=status.HTTP_404_NOT_FOUND)
+        variant = request.query_params.get('variant')
+        if variant:
+            name = variant_names(media).get(variant)
+            if name is None:
+                return Response({'detail': 'Not found'}, status=status.HTTP_404_NOT_FOUND)
+            # Variants are JPEGs made by api/media.py
+            return serve_file(request, name, f'{media.content_hash}-{variant}', 'image')
+        return serve_file(request, media.file.name, media.content_hash or None, media.media_type)
+
+
 class AccountDeletionScheduleView(APIView):
     permission_classes = (permissions.IsAuthenticated,)
 
@@ -198,6 +516,44 @@ class AccountDeletionScheduleView(APIView):
 
     def delete(self, request):
         user = request.user
+        if user.deletion_scheduled_at and user.deletion_scheduled_at <= timezone.now() - grace_period():
+            # The purge job may already be removing the account's data
+            return Response({'detail': 'Deletion is already in progress.'}, status=400)
         user.deletion_scheduled_at = None
         user.save()
         return Response({'detail': 'Account deletion canceled.'})
+
+
+class MetricsView(APIView):
+    # Scrapers use the static METRICS_TOKEN; staff can use their usual JWT
+    authentication_classes = (MetricsTokenAuthentication, JWTAuthentication)
+    permission_classes = (CanReadMetrics,)
+
+    def perform_content_negotiation(self, request, force=False):
+        # Prometheus asks for text/plain or OpenMetrics; errors still render as JSON
+        return super().perform_content_negotiation(request, force=True)
+
+    def get(self, request):
+        return HttpResponse(metrics_registry.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
+class ProfilingReportListView(APIView):
+    permission_classes = (permissions.IsAdminUser,)
+
+    def get(self, request):
+        return Response(list_reports())
+
+
+class ProfilingReportView(APIView):
+    permission_classes = (permissions.IsAdminUser,)
+
+    def get(self, request, report_id, pstats=False):
+        try:
+            path = report_path(report_id, 'pstats' if pstats else 'json')
+            f = open(path, 'rb')
+        except (ValueError, FileNotFoundError):
+            return Response({'detail': 'Not found'}, status=status.HTTP_404_NOT_FOUND)
+        if pstats:
+            # Open with snakeviz or `python -m pstats`
+            return FileResponse(f, as_attachment=True, filename=f'{report_id}.pstats', content_type='application/octet-stream')
+        return FileResponse(f, content_type='application/json')
@@ -0,0 +1,69 @@
+from django.db import IntegrityError, transaction
+
+from .models import Skill, Hobby
+
+# In-process name -> id cache for the Skill and Hobby vocabularies. Names are
+# unique and rows are practically never renamed, so entries stay valid across
+# requests; api/signals.py drops an entry when its row is renamed or deleted.
+# Ids are only cached once the transaction that read or created them commits,
+# and assign() copes with rows deleted by another process.
+_ids = {Skill: {}, Hobby: {}}
+
+
+def resolve(model, names):
+    """Return the ids of `names` (de-duplicated, in order), creating missing rows.
+
+    Costs no query when every name is cached, otherwise one lookup plus, for
+    unknown names, one bulk insert and one re-read.
+    """
+    names = list(dict.fromkeys(names))
+    known = _ids[model]
+    missing = [n for n in names if n not in known]
+    if missing:
+        found = dict(model.objects.filter(name__in=missing).values_list('name', 'id'))
+        new = [n for n in missing if n not in found]
+        if new:
+            # ignore_conflicts: another request may create the same name concurrently
+            model.objects.bulk_create([model(name=n) for n in new], ignore_conflicts=True)
+            found.update(model.objects.filter(name__in=new).values_list('name', 'id'))
+        # A rollback would leave ids of rows that never existed in the cache
+        transaction.on_commit(lambda: known.update(found))
+        return [known[n] if n in known else found[n] for n in names]
+    return [known[n] for n in names]
+
+
+def assign(related, model, names):
+    """`related.set()` to the `model` rows named `names`, creating missing ones.
+
+    A cached id goes stale when another process deletes its row. Outside a
+    transaction the write then fails on the foreign key as it commits, so the
+    cache is dropped and the write retried once. Inside the caller's
+    transaction that check waits for the caller's commit, too late to retry,
+    so the ids are re-read first instead (one query).
+    """
+    if transaction.get_connection().in_atomic_block:
+        ids = resolve(model, names)
+        if model.objects.filter(id__in=ids).count() != len(ids):
+            clear()
+            ids = resolve(model, names)
+        related.set(ids)
+        return
+    try:
+        with transaction.atomic():
+            related.set(resolve(model, names))
+    except IntegrityError:
+        clear()
+        with transaction.atomic():
+            related.set(resolve(model, names))
+
+
+def forget(model, pk):
+    known = _ids[model]
+    for name in [n for n, i in known.items() if i == pk]:
+        del known[name]
+
+
+def clear():
+    """Forget every cached id (for tools that switch to another database)."""
+    for known in _ids.values():
+        known.clear()
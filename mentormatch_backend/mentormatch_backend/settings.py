@@ -22,16 +22,26 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    # Outermost, so its latency includes the rest of the stack
+    'api.metrics.MetricsMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'api.profiling.ProfilingMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'api.querybudget.QueryBudgetMiddleware',
 ]
 
+# Raise instead of logging when a view exceeds its declared query_budget
+QUERY_BUDGET_STRICT = os.environ.get('QUERY_BUDGET_STRICT') == '1'
+
+# Static bearer token Prometheus scrapes /api/metrics/ with (empty: staff JWT only)
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN', '')
+
 ROOT_URLCONF = 'mentormatch_backend.urls'
 
 TEMPLATES = [
@@ -59,6 +69,86 @@ DATABASES = {
     }
 }
 
+# SQLite tuning, picked with the SQLITE_PROFILE environment variable.
+# "production" switches to WAL (readers no longer wait for writers) with
+# synchronous=NORMAL, a 64 MiB page cache and 256 MiB of memory-mapped I/O,
+# applied to every new connection. Write transactions start IMMEDIATE so
+# they queue on the busy timeout instead of failing with "database is
+# locked", and connections are reused across requests.
+SQLITE_PROFILES = {
+    'default': {},
+    'production': {
+        'CONN_MAX_AGE': 600,
+        'CONN_HEALTH_CHECKS': True,
+        'OPTIONS': {
+            'init_command': (
+                'PRAGMA journal_mode=WAL;'
+                'PRAGMA synchronous=NORMAL;'
+                'PRAGMA cache_size=-65536;'
+                'PRAGMA mmap_size=268435456;'
+                'PRAGMA temp_store=MEMORY'
+            ),
+            'transaction_mode': 'IMMEDIATE',
+            'timeout': 20,  # seconds to wait for the write lock
+        },
+    },
+}
+SQLITE_PROFILE = os.environ.get('SQLITE_PROFILE', 'default')
+DATABASES['default'].update(SQLITE_PROFILES[SQLITE_PROFILE])
+
+# Read replicas (see api/replicas.py): DATABASE_REPLICA_NAMES is a
+# comma-separated list of SQLite files, each added as an alias replica1,
+# replica2, ... with the primary's settings. Only GETs of views using
+# ReplicaReadMixin read from them.
+DATABASE_REPLICAS = []
+for _i, _name in enumerate(filter(None, os.environ.get('DATABASE_REPLICA_NAMES', '').split(',')), 1):
+    DATABASES[f'replica{_i}'] = {**DATABASES['default'], 'NAME': _name.strip(), 'TEST': {'MIRROR': 'default'}}
+    DATABASE_REPLICAS.append(f'replica{_i}')
+DATABASE_ROUTERS = ['api.replicas.ReplicaRouter']
+# Seconds a user's reads stay on the primary after they swipe or post a message
+REPLICA_STICKY_SECONDS = 10
+
+# Local in-process cache by default; point this at Redis/Memcached when
+# running several workers so invalidations reach every process.
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'mentormatch',
+        'OPTIONS': {'MAX_ENTRIES': 10000},
+    }
+}
+
+# Pub/sub used to push new chat messages to long-polling clients
+CHAT_BROKER = 'api.realtime.InProcessBroker'
+
+# Seconds a serialized profile stays cached (see api/profile_cache.py)
+PROFILE_CACHE_TIMEOUT = 300
+
+# Stored match scores kept per user; candidates beyond them get the base score
+MATCH_SCORE_TOP_N = 100
+
+# Threads generating media thumbnails after upload (see api/media.py)
+MEDIA_WORKERS = 2
+
+# How media files reach the client after the access check: '' streams them
+# from Django, 'x-sendfile' (Apache) or 'x-accel-redirect' (nginx, internal
+# location at MEDIA_ACCEL_PREFIX aliased to MEDIA_ROOT) hand off to the
+# front server.
+MEDIA_SENDFILE = os.environ.get('MEDIA_SENDFILE', '')
+MEDIA_ACCEL_PREFIX = '/protected-media/'
+# Seconds signed media URLs stay valid, and who-may-see-whose-media is cached
+MEDIA_URL_MAX_AGE = 3600
+MEDIA_ACCESS_CACHE_TIMEOUT = 300
+
+# Request profiling (see api/profiling.py): staff opt in with ?profile=1 or
+# "X-Profile: 1"; this fraction of all requests is profiled as well.
+PROFILING_SAMPLE_RATE = float(os.environ.get('PROFILING_SAMPLE_RATE', '0'))
+PROFILING_DIR = os.path.join(BASE_DIR, 'profiles')
+PROFILING_MAX_REPORTS = 200
+
+# Days between scheduling an account deletion and purge_deleted_accounts removing it
+ACCOUNT_DELETION_GRACE_DAYS = 7
+
 AUTH_PASSWORD_VALIDATORS = []
 
 LANGUAGE_CODE = 'en-us'
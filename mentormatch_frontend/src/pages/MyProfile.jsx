@@ -1,5 +1,5 @@
 import React, { useEffect, useState } from 'react'
-import { apiClient, API_BASE } from '../api'
+import { apiClient } from '../api'
 import { logApiError, extractFieldErrors } from '../utils/errors'
 import { getActiveAccessToken } from '../utils/sessions'
 import { FiLogOut } from 'react-icons/fi'
@@ -126,8 +126,8 @@ export default function MyProfile(){
       <h3 style={{marginTop:0, marginBottom:'20px', fontSize:'20px', fontWeight:'600'}}>My Media</h3>
       <div className="media-grid">
         {media.map(m=> (
-          <a href={`${API_BASE}${m.file}`} key={m.id} target="_blank" rel="noreferrer">
-            {m.media_type==='image' ? <img src={`${API_BASE}${m.file}`} alt={m.caption||''} /> : <video src={`${API_BASE}${m.file}`} controls />}
+          <a href={m.url} key={m.id} target="_blank" rel="noreferrer">
+            {m.media_type==='image' ? <img src={m.url} alt={m.caption||''} /> : <video src={m.url} controls />}
           </a>
         ))}
       </div>
@@ -1,6 +1,6 @@
 import React, { useEffect, useState } from 'react'
 import { useParams, Link } from 'react-router-dom'
-import { apiClient, API_BASE } from '../api'
+import { apiClient } from '../api'
 import { getActiveAccessToken } from '../utils/sessions'
 
 export default function UserProfile(){
@@ -57,9 +57,9 @@ export default function UserProfile(){
           {media.length===0 ? <p>Visible after you match with this user.</p> : (
             <div className="media-grid">
               {media.map(m=> (
-                <a href={`${API_BASE}${m.file}`} key={m.id} target="_blank" rel="noreferrer">
-                  {m.media_type==='image' ? <img src={`${API_BASE}${m.file}`} alt={m.caption||''} /> :
-                    <video src={`${API_BASE}${m.file}`} controls style={{width:'100%'}} />}
+                <a href={m.url} key={m.id} target="_blank" rel="noreferrer">
+                  {m.media_type==='image' ? <img src={m.url} alt={m.caption||''} /> :
+                    <video src={m.url} controls style={{width:'100%'}} />}
                 </a>
               ))}
             </div>